@@ -41,5 +41,6 @@
 
 from lib.client import Client
 from lib.server import Server
-from lib.structs import Message, send_message
+from lib.worker import Worker
+from lib.structs import Message, Connection, read_status, send_message
 from lib.command import powerctl, print_error, check_error
@@ -38,18 +38,49 @@
 #   The Client class is the daemon responsible for the primary un-privileged
 #   functions executed by SMD.
 
+from time import sleep
 from uuid import uuid4
+from threading import Lock
 from os.path import exists
+from collections import deque
 from lib.util.file import expand
+from lib.structs.loop import AsyncPoll
 from lib.structs import Service, Message
-from lib.constants import VERSION, HOOK_NOTIFICATION
 from select import epoll, EPOLLERR, EPOLLHUP, EPOLLIN
-from lib.constants.config import NAME_CLIENT, LOG_PAYLOAD, DIRECTORY_MODULES
+from lib.structs.message import CODEC_JSON, Reader, codecs
+from lib.constants import (
+    VERSION,
+    HOOK_LOG,
+    HOOK_HELLO,
+    HOOK_RELOAD,
+    HOOK_SHUTDOWN,
+    HOOK_NOTIFICATION,
+)
+from lib.constants.config import (
+    CORE_ASYNC,
+    NAME_CLIENT,
+    LOG_PAYLOAD,
+    DIRECTORY_MODULES,
+    SOCKET_REPLAY_SIZE,
+    SOCKET_RECONNECT_MIN,
+    SOCKET_RECONNECT_MAX,
+)
 from socket import socket, AF_UNIX, SHUT_RDWR, SOL_SOCKET, SOCK_STREAM, SO_REUSEADDR
 
 
 class Client(Service):
-    __slots__ = ("_path", "_uuid", "_socket", "_messages")
+    __slots__ = (
+        "_lock",
+        "_path",
+        "_uuid",
+        "_codec",
+        "_hooks",
+        "_reader",
+        "_replay",
+        "_socket",
+        "_running",
+        "_messages",
+    )
 
     def __init__(self, config, sock, level, log, read_only, journal):
         Service.__init__(
@@ -63,48 +94,56 @@ class Client(Service):
             journal,
         )
         self._path = sock
+        self._lock = Lock()
+        self._hooks = None
         self._socket = None
+        self._running = False
         self._messages = list()
+        self._replay = deque(maxlen=SOCKET_REPLAY_SIZE)
+        self._codec = CODEC_JSON
         self._uuid = str(uuid4())
+        self._reader = Reader()
 
     def stop(self):
+        self._running = False
+        self._stop_loop()
         self._dispatcher.stop()
         if self._socket is None:
-            return
+            return self._close_loop()
         try:
             self._socket.shutdown(SHUT_RDWR)
             self._socket.close()
         except OSError as err:
             self.error(f'[main]: Cannot close the socket "{self._path}"!', err)
         self._socket = None
+        self._close_loop()
 
     def start(self):
         self.info(f"[main]: Starting System Management Daemon Client (v{VERSION})..")
         if not exists(self._path):
             return self.error(f'[main]: Socket "{self._path}" does not exist!')
         try:
-            self._socket = socket(AF_UNIX, SOCK_STREAM)
-            self._socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
-            self._socket.connect(self._path)
-            self._socket.setblocking(False)
+            self._socket = self._connect()
         except OSError as err:
-            if self._socket is not None:
-                self._socket.close()
             return self.error(
                 f'[main]: Cannot connect to the socket "{self._path}"!', err
             )
         self.debug(f'[main]: Connection UUID is "{self._uuid}".')
-        r, p = True, epoll()
+        if CORE_ASYNC:
+            self.debug("[main]: Using the asyncio core.")
+            p = AsyncPoll(self._loop, self._process_async)
+        else:
+            p = epoll()
         p.register(self._socket.fileno(), EPOLLIN)
+        self._running = True
         self._dispatcher.start()
         try:
-            while r:
-                if self._socket is None:
-                    break
-                for _, e in p.poll(None):
-                    r = self._process(e)
-                    if r:
-                        continue
+            while self._running:
+                if CORE_ASYNC:
+                    self._loop.run_forever()
+                else:
+                    self._poll(p)
+                if not self._running or not self._reconnect(p):
                     break
         except KeyboardInterrupt:
             self.debug("[main]: Stopping Client Thread..")
@@ -112,13 +151,88 @@ class Client(Service):
             return self.error("[main]: Unexpected runtime error!", err)
         finally:
             self.info("[main]: Stopping System Management Daemon Client..")
-            p.unregister(self._socket.fileno())
+            if self._socket is not None:
+                p.unregister(self._socket.fileno())
             p.close()
             self.stop()
-            del p, r
+            del p
         self.info("[main]: Shutdown complete.")
         return True
 
+    def _poll(self, poll):
+        while self._socket is not None:
+            for _, e in poll.poll(None):
+                if not self._process(e):
+                    return
+
+    def _hello(self):
+        # NOTE(dij): Tell the Server which Hooks we have, so it only forwards
+        #            what we can handle. Log and Reload are handled by the
+        #            Dispatcher itself.
+        h = list(self._hooks)
+        h.extend((HOOK_LOG, HOOK_RELOAD))
+        try:
+            return Message(HOOK_HELLO, {"codecs": codecs(), "hooks": h})
+        finally:
+            del h
+
+    def _connect(self):
+        s = socket(AF_UNIX, SOCK_STREAM)
+        try:
+            s.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            s.connect(self._path)
+            s.setblocking(False)
+        except OSError:
+            s.close()
+            raise
+        return s
+
+    def _reconnect(self, poll):
+        # NOTE(dij): Modules and their processes are kept running while the
+        #            Server is away (ex: it's being restarted), so we only need
+        #            to replace the socket.
+        with self._lock:
+            if self._socket is not None:
+                try:
+                    poll.unregister(self._socket.fileno())
+                except (OSError, ValueError):
+                    pass
+                self._socket.close()
+                self._socket = None
+        self._reader.reset()
+        self.info("[main]: Lost the connection to the Server, reconnecting..")
+        w = SOCKET_RECONNECT_MIN
+        while self._running:
+            sleep(w)
+            try:
+                s = self._connect()
+            except OSError as err:
+                w = min(w * 2, SOCKET_RECONNECT_MAX)
+                self.debug(
+                    f'[main]: Cannot reconnect to the socket "{self._path}", retrying in {w}s..',
+                    err,
+                )
+                continue
+            with self._lock:
+                self._socket, self._codec = s, CODEC_JSON
+                if self._hooks is not None:
+                    self._write(self._hello())
+                q = list(self._replay)
+                self._replay.clear()
+                for m in q:
+                    self._write(m)
+            poll.register(s.fileno(), EPOLLIN)
+            self.info(
+                f"[main]: Reconnected to the Server, replayed {len(q)} message(s)."
+            )
+            del s, w, q
+            return True
+        return False
+
+    def loaded(self, hooks):
+        self._hooks = list(hooks)
+        self._send_one(self._hello())
+
     def send(self, _, message):
         if isinstance(message, Message):
             return self._send_one(message)
@@ -133,37 +247,75 @@ class Client(Service):
 
     def _send_one(self, message):
         message["id"] = self._uuid
+        # NOTE(dij): Hooks can send from multiple lanes at once, don't let
+        #            their frames interleave.
+        with self._lock:
+            self._write(message)
+
+    def _write(self, message):
+        # NOTE(dij): Only called with the lock held.
+        if self._socket is None:
+            return self._buffer(message)
         try:
-            message.send(self._socket)
+            message.send(self._socket, self._codec)
             self.debug(f"[conn]: Message 0x{message.header():02X} was sent.")
             if LOG_PAYLOAD:
                 self.error(f"[dump]: OUT > {message}")
         except OSError as err:
-            if err.errno == 0x20:
+            # NOTE(dij): EPIPE, ECONNRESET (both ConnectionErrors) and ENOTCONN
+            #            all mean the Server went away (or is restarting), so
+            #            keep the message for when we reconnect.
+            if isinstance(err, ConnectionError) or err.errno == 0x6B:
+                self._buffer(message)
                 return self.info("[conn]: Server has disconnected!")
             self.error(f"[conn]: Cannot send message 0x{message.header():02X}!", err)
         except Exception as err:
             self.error(f"[conn]: Cannot send message 0x{message.header():02X}!", err)
 
+    def _buffer(self, message):
+        # NOTE(dij): The Hello message is sent again on reconnect, so it's not
+        #            kept. When full, the oldest messages are dropped first.
+        if message.header() == HOOK_HELLO:
+            return
+        if len(self._replay) == self._replay.maxlen:
+            self.warning(
+                f"[conn]: Replay buffer is full, dropping message 0x{self._replay[0].header():02X}!"
+            )
+        self._replay.append(message)
+
+    def _process_async(self, _, __, event):
+        if not self._process(event):
+            self._loop.stop()
+
     def _process(self, poll_msg):
         if poll_msg & EPOLLHUP or poll_msg & EPOLLERR:
             return self.debug("[conn]: Disconnecting..")
         if not (poll_msg & EPOLLIN):
             return True
         try:
-            self._socket.setblocking(True)
-            m = Message(stream=self._socket)
-            self._dispatcher.add(None, m)
-            self.debug(f"[conn]: Received Message 0x{m.header():02X}.")
-            if LOG_PAYLOAD:
-                self.error(f"[dump]:  IN < {m}")
-            del m
+            for m in self._reader.read(self._socket):
+                if m.header() == HOOK_HELLO:
+                    self._codec = m.get("codec", CODEC_JSON)
+                    self.debug(f'[conn]: Negotiated the "{self._codec}" codec.')
+                    continue
+                # NOTE(dij): The Server is going away (ex: it's being restarted),
+                #            our modules keep running while we reconnect. They
+                #            are only shut down when the Client itself stops.
+                if m.header() == HOOK_SHUTDOWN:
+                    self.debug("[conn]: Server is shutting down.")
+                    continue
+                self._dispatcher.add(None, m)
+                self.debug(f"[conn]: Received Message 0x{m.header():02X}.")
+                if LOG_PAYLOAD:
+                    self.error(f"[dump]:  IN < {m}")
+                del m
         except OSError as err:
             if err.errno == 0x3E8 or err.errno == 0x68:
                 return self.debug("[main]: Disconnecting..")
             self.error("[conn]: Unexpected connection error!", err)
-        finally:
-            self._socket.setblocking(False)
+            # NOTE(dij): The stream position is unknown after a bad frame, so
+            #            we cannot recover from this.
+            return False
         return True
 
     def notify(self, title, message=None, icon=None):
@@ -46,6 +46,7 @@ from importlib import import_module
 from lib.util.file import perm_check
 from sys import exit, stderr, _getframe
 from lib.args import ARGS, DESCRIPTIONS
+from lib.structs.message import Connection
 from os.path import basename, isdir, relpath
 from lib.constants import EMPTY, NEWLINE, VERSION
 from lib.constants.config import (
@@ -115,22 +116,27 @@ def powerctl():
             f"System: {NAME} ({NAME_SERVER} / {NAME_CLIENT})"
         )
         exit(0)
-    if hasattr(a, "subs") and isinstance(a.subs, dict) and len(a.subs) > 0:
-        try:
-            r = _exec_subs(a)
-        except Exception as err:
-            return print_error("Error during runtime!", err)
-    else:
-        r = False
-    if not r:
-        if "func" in a and callable(a.func):
+    # NOTE(dij): Share one connection between every request this command makes.
+    a.socket = Connection(a.socket)
+    try:
+        if hasattr(a, "subs") and isinstance(a.subs, dict) and len(a.subs) > 0:
             try:
-                a.func(a)
+                r = _exec_subs(a)
             except Exception as err:
                 return print_error("Error during runtime!", err)
         else:
-            m.print_help()
-            exit(2)
+            r = False
+        if not r:
+            if "func" in a and callable(a.func):
+                try:
+                    a.func(a)
+                except Exception as err:
+                    return print_error("Error during runtime!", err)
+            else:
+                m.print_help()
+                exit(2)
+    finally:
+        a.socket.close()
     del r, a, m
 
 
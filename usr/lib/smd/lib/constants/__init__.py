@@ -69,6 +69,9 @@ CUSTOM_DEFAULTS = "/opt/spaceport/var/cache/smd/defaults.json"
 # System Hooks
 HOOK_OK = 0xC8
 HOOK_LOG = 0xF0
+HOOK_HELLO = 0xF1
+HOOK_WORKER = 0xF2
+HOOK_HANDOFF = 0xF3
 HOOK_ERROR = 0xFF
 HOOK_RELOAD = 0xF5
 HOOK_DAEMON = 0x00
@@ -104,6 +107,11 @@ MSG_ACTION = 0x03
 MSG_CONFIG = 0x04
 MSG_UPDATE = 0x05
 
+## Status Snapshot Names
+STATUS_HYDRA = "hydra"
+STATUS_BACKUP = "backup"
+STATUS_LOCKER = "locker"
+
 ## Hydra Constants
 # Machine State
 HYDRA_STATE_DONE = 0x4
@@ -48,8 +48,11 @@ from lib.constants import (
     HOOK_OK,
     HOOK_LOG,
     HOOK_LOCK,
+    HOOK_HYDRA,
+    HOOK_DAEMON,
     HOOK_POWER,
     HOOK_BACKUP,
+    HOOK_LOCKER,
     HOOK_RELOAD,
     HOOK_MONITOR,
     HOOK_SUSPEND,
@@ -82,13 +85,100 @@ DIRECTORY_LIB = f"{DIRECTORY_BASE}/lib"
 DIRECTORY_TEMP = "/var/run/smd"
 DIRECTORY_CONFIG = "/var/cache/smd"
 DIRECTORY_MODULES = f"{DIRECTORY_LIB}/modules"
+DIRECTORY_STATUS = f"{DIRECTORY_TEMP}/status"
 DIRECTORY_LIBEXEC = f"{DIRECTORY_BASE}/libexec"
 DIRECTORY_POWERCTL = f"{DIRECTORY_LIB}/powerctl"
 
+# Core Constants
+# NOTE(dij): The asyncio core only runs the Server and Client socket handling
+#            on the loop. The Dispatcher, lanes and Executer are still Threads,
+#            so coroutine Hooks are handed to the loop from them. It is not
+#            faster than epoll, "tests/bench_socket.py" compares the two.
+CORE_ASYNC = False
+
 # Socket Constants
-SOCKET = f"{DIRECTORY_TEMP}/{NAME}.sock"
+# NOTE(dij): The socket name is fixed, so "smd-daemon.socket" can listen on the
+#            same path. systemd has no way to lowercase the hostname like NAME.
+SOCKET = f"{DIRECTORY_TEMP}/smd.sock"
 SOCKET_GROUP = "smd"
+SOCKET_CODECS = ["msgpack", "json"]
 SOCKET_BACKLOG = 512
+SOCKET_IOV_MAX = 512
+SOCKET_BUF_SIZE = 65536
+SOCKET_FRAME_MAX = 0x4000000  # 64MB
+# NOTE(dij): Payloads larger than this are sent as a chain of continuation
+#            frames. Keep this below "SOCKET_BUF_SIZE", so every chunk fits in
+#            the Reader buffer.
+SOCKET_CHUNK_SIZE = 0x8000  # 32KB
+SOCKET_ROUTES = 1024
+SOCKET_QUEUE_SIZE = 1024
+SOCKET_QUEUE_POLICY = "drop"  # or "disconnect"
+# NOTE(dij): Clients reconnect if the Server goes away, waiting between attempts
+#            (doubling up to the max seconds). Up to "SOCKET_REPLAY_SIZE" outgoing
+#            messages are kept while disconnected and sent once reconnected.
+SOCKET_REPLAY_SIZE = 256
+SOCKET_RECONNECT_MIN = 0.25
+SOCKET_RECONNECT_MAX = 30
+
+# Dispatch Constants
+DISPATCH_LANES = True
+DISPATCH_WORKERS = 4
+DISPATCH_INTERVAL = 1
+# NOTE(dij): Daemon Hooks run every "DISPATCH_INTERVAL" seconds unless their
+#            module sets "INTERVAL". They can return the seconds until they want
+#            to run next, or False if they had nothing to do, which doubles their
+#            interval (up to "DISPATCH_IDLE_MAX" seconds) until their module gets
+#            a Message.
+DISPATCH_IDLE_MAX = 300
+DISPATCH_PRIORITY = {
+    HOOK_LOCK: 0,
+    HOOK_LOCKER: 0,
+    HOOK_SUSPEND: 0,
+    HOOK_HIBERNATE: 0,
+    HOOK_HYDRA: 20,
+    HOOK_BACKUP: 20,
+}
+DISPATCH_PRIORITY_DEFAULT = 10
+# NOTE(dij): A message for these Hooks replaces ("replace") or is merged into
+#            ("merge") a message of the same Hook and type that is still queued.
+DISPATCH_COALESCE = {HOOK_POWER: "replace", HOOK_MONITOR: "replace"}
+# NOTE(dij): Replies to these Hooks are held until every lane is done with the
+#            message, so they are sent together.
+DISPATCH_BARRIER = [HOOK_SUSPEND, HOOK_HIBERNATE]
+# NOTE(dij): Server modules listed here (ex: "hydra") run in their own supervised
+#            worker process, which is restarted (with backoff up to the max
+#            seconds) if it exits.
+DISPATCH_ISOLATE = list()
+# NOTE(dij): Time budget (in milliseconds) of a single Hook function, by Hook.
+#            Functions that run longer are reported by the Watchdog with the
+#            time they took. Hooks not listed use "TIMEOUT_SEC_HOOK".
+DISPATCH_BUDGET = {HOOK_DAEMON: 5000}
+# NOTE(dij): Tasks may run up to their "slack" seconds late, so tasks that are
+#            due close together run in a single wakeup. Tasks without a slack
+#            get "DISPATCH_SLACK" of their timeout (up to "DISPATCH_SLACK_MAX"
+#            seconds), which is multiplied by "DISPATCH_SLACK_BATTERY" when the
+#            "DISPATCH_POWER_PATH" shows the device is on battery.
+DISPATCH_SLACK = 0.05
+DISPATCH_SLACK_MAX = 5
+DISPATCH_SLACK_BATTERY = 4
+DISPATCH_POWER_PATH = "/sys/class/power_supply/AC/online"
+DISPATCH_RESTART_MAX = 30
+
+# Loader Constants
+# NOTE(dij): The Hooks each module exposes are kept in a manifest, checked
+#            against the module file stats, so modules are only imported when
+#            one of their Hooks gets a Message. Modules with daemon or startup
+#            Hooks, or with a Class that has a setup function, are always
+#            imported.
+LOADER_LAZY = True
+LOADER_MANIFEST_CLIENT = "${HOME}/.cache/smd/modules.json"
+LOADER_MANIFEST_SERVER = f"{DIRECTORY_CONFIG}/modules.json"
+
+# Status Snapshot Constants
+# NOTE(dij): Snapshots are JSON documents kept in shared memory, so each one is
+#            limited to this size.
+STATUS_SIZE = 0x40000  # 256KB
+STATUS_RETRIES = 64
 
 # Waiting/Timeout Constants
 TIMEOUT_SEC_STOP = 15
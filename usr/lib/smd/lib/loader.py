@@ -38,14 +38,108 @@
 #   The Loader class file is not a class but a static function list for loading
 #   and creating module class files and objects directly from the module folders.
 
-from os import listdir
 from io import StringIO
+from threading import Lock
 from inspect import isclass
 from importlib import import_module
 from os.path import isdir, basename
-from lib.util.file import perm_check
+from os import listdir, stat, getuid
 from lib.structs.hook import Hook, HookList
+from lib.util.file import perm_check, expand, read_json, write_json
+from lib.constants.config import (
+    LOADER_LAZY,
+    DISPATCH_ISOLATE,
+    LOADER_MANIFEST_CLIENT,
+    LOADER_MANIFEST_SERVER,
+)
 from lib.command import try_get_attr, module_base
+from lib.structs.worker import RemoteHook, WorkerHost
+from lib.constants import (
+    HOOK_DAEMON,
+    HOOK_RELOAD,
+    HOOK_HANDOFF,
+    HOOK_STARTUP,
+    HOOK_SHUTDOWN,
+)
+
+# NOTE(dij): Modules with these Hooks are imported right away, as they get a
+#            Message as soon as the Dispatcher starts.
+_EAGER = frozenset((HOOK_DAEMON, HOOK_STARTUP))
+# NOTE(dij): A module that was never imported has nothing to reload, clean up
+#            or hand off, so these don't import it.
+_SKIP = frozenset((HOOK_RELOAD, HOOK_SHUTDOWN, HOOK_HANDOFF))
+
+
+class LazyHook(object):
+    __slots__ = ("_hook", "_lane", "_module")
+
+    def __init__(self, module, hook, lane):
+        self._hook = hook
+        self._lane = lane
+        self._module = module
+
+    def __str__(self):
+        return f"{self._module.name()}/0x{self._hook:02X}"
+
+    @property
+    def _class(self):
+        return self._module.module()
+
+    def lane(self):
+        return self._lane
+
+    def run(self, service, message, queue):
+        if self._hook in _SKIP and self._module.module() is None:
+            return True
+        h = self._module.hooks(service, self._hook)
+        if h is None:
+            return False
+        for i in h:
+            i.run(service, message, queue)
+        del h
+        return True
+
+
+class LazyModule(object):
+    __slots__ = ("_func", "_lock", "_name", "_path", "_hooks", "_module")
+
+    def __init__(self, name, path, func):
+        self._func = func
+        self._name = name
+        self._path = path
+        self._lock = Lock()
+        self._hooks, self._module = None, None
+
+    def name(self):
+        return self._name
+
+    def module(self):
+        return self._module
+
+    def _load(self, service):
+        service.debug(f'[loader]: Loading module "{self._path}" on first use..')
+        try:
+            perm_check(self._path, 0o7022, 0, 0)
+            i = import_module(self._name)
+        except Exception as err:
+            return service.error(f'[loader]: Cannot import module "{self._path}"!', err)
+        try:
+            e = _get_hooks(service, i, self._func)
+            if e is not None:
+                _load_module_hooks(service, self._hooks, i, e)
+        except Exception as err:
+            service.error(f'[loader]: Cannot load module "{self._path}"!', err)
+        self._module = i
+        del i
+
+    def hooks(self, service, hook):
+        # NOTE(dij): Only tried once, a module that fails to import stays
+        #            without Hooks until the next start.
+        with self._lock:
+            if self._hooks is None:
+                self._hooks = dict()
+                self._load(service)
+            return self._hooks.get(hook)
 
 
 def _hooks_to_str(hooks):
@@ -92,38 +186,146 @@ def _get_func(obj, name, args=0):
     return x
 
 
+def _has_setup(service, module, hooks):
+    # NOTE(dij): Classes with a setup function do work as soon as they are
+    #            created (start timers, check the displays, etc.), so their
+    #            modules can't wait until a Hook is used.
+    n = "setup_server" if service.is_server() else "setup"
+    for v in hooks.values():
+        for i in v if isinstance(v, list) else (v,):
+            if not isinstance(i, str) or "." not in i:
+                continue
+            c = getattr(module, i[: i.find(".")], None)
+            if isclass(c) and callable(getattr(c, n, None)):
+                return True
+            del c
+    return False
+
+
+def _manifest(service):
+    if service.is_server():
+        return LOADER_MANIFEST_SERVER
+    return expand(LOADER_MANIFEST_CLIENT)
+
+
+def _read_manifest(service, path):
+    if path is None:
+        return dict()
+    try:
+        perm_check(path, 0o0137, getuid())
+        r = read_json(path)
+    except FileNotFoundError:
+        return dict()
+    except (OSError, ValueError) as err:
+        service.debug(f'[loader]: Cannot read the module manifest "{path}"!', err)
+        return dict()
+    if not isinstance(r, dict):
+        return dict()
+    return r
+
+
+def _manifest_entry(v, st):
+    # NOTE(dij): Only used if the module file was not changed (or had its
+    #            permissions changed) since the entry was made.
+    if not isinstance(v, dict) or v.get("stat") != _stat(st):
+        return None
+    h, n = v.get("hooks"), v.get("lane")
+    if not isinstance(h, list) or not all(isinstance(i, int) for i in h):
+        return None
+    if not isinstance(v.get("setup"), bool):
+        return None
+    if n is not None and not isinstance(n, str):
+        return None
+    return v
+
+
+def _stat(st):
+    return [st.st_mtime_ns, st.st_size, st.st_ino, st.st_mode, st.st_uid, st.st_gid]
+
+
 def load_modules(service, directory):
     if not isdir(directory):
         raise OSError(f'path "{directory}" is not a directory')
     e, x, b = dict(), listdir(directory), module_base(directory)
     f = "hooks_server" if service.is_server() else "hooks"
+    # NOTE(dij): Workers only load their own module, and the Server hands the
+    #            isolated modules off to workers.
+    o = service.isolated()
+    w = DISPATCH_ISOLATE if o is None and service.is_server() else None
+    p = _manifest(service) if o is None and LOADER_LAZY else None
+    c, u = _read_manifest(service, p), dict()
     for m in x:
         if not m.endswith(".py"):
             continue
+        d = f"{directory}/{m}"
+        t = stat(d)
         # NOTE(dij): Only root can own these file and they cannot be writable by
         #            non-root users.
-        perm_check(f"{directory}/{m}", 0o7022, 0, 0)
+        perm_check(d, 0o7022, 0, 0, st=t)
         n = m[:-3].lower()
         if "/" in n or "\\" in n:
             n = basename(n)
-        service.debug(f'[loader]: Loading module "{directory}/{m}"..')
+        if o is not None and n != o:
+            continue
+        v = _manifest_entry(c.get(d), t) if p is not None else None
+        if v is not None and w is not None and n in w:
+            u[d] = v
+            _load_worker(service, e, n, v["hooks"])
+            del d, t, m, n, v
+            continue
+        if v is not None and not v["setup"] and _EAGER.isdisjoint(v["hooks"]):
+            u[d] = v
+            _load_lazy(service, e, LazyModule(f"{b}.{n}", d, f), v)
+            del d, t, m, n, v
+            continue
+        service.debug(f'[loader]: Loading module "{d}"..')
         try:
             i = import_module(f"{b}.{n}")
         except ImportError as err:
-            service.error(f'[loader]: Cannot import module "{directory}/{m}"!', err)
+            service.error(f'[loader]: Cannot import module "{d}"!', err)
             continue
-        finally:
-            del n
         try:
-            _load_module_hooks(service, e, i, f)
+            h = _get_hooks(service, i, f)
+            if h is None:
+                continue
+            if p is not None:
+                v = getattr(i, "LANE", i.__name__)
+                if v is None or isinstance(v, str):
+                    u[d] = {
+                        "stat": _stat(t),
+                        "hooks": list(h.keys()),
+                        "lane": v,
+                        "setup": _has_setup(service, i, h),
+                    }
+            if w is not None and n in w:
+                _load_worker(service, e, n, h.keys())
+            else:
+                _load_module_hooks(service, e, i, h)
+            del h
         except Exception as err:
-            service.error(f'[loader]: Cannot load module "{directory}/{m}"!', err)
-        del i, m
-    del x, f
+            service.error(f'[loader]: Cannot load module "{d}"!', err)
+        del i, d, t, m, n, v
+    if p is not None and u != c:
+        try:
+            write_json(p, u, perms=0o0640)
+        except (OSError, ValueError, TypeError) as err:
+            service.warning(f'[loader]: Cannot save the module manifest "{p}"!', err)
+    del x, f, o, w, p, c, u
     service.info(f'[loader]: Loaded {len(e)} Hooks from "{directory}".')
     return e
 
 
+def _load_lazy(service, hooks, module, entry):
+    service.debug(
+        f'[loader/l]: Module "{module.name()}" exposes {len(entry["hooks"])} Hooks, '
+        "it will be loaded on first use."
+    )
+    for h in entry["hooks"]:
+        if h not in hooks:
+            hooks[h] = HookList()
+        hooks[h].append(LazyHook(module, h, entry["lane"]))
+
+
 def _load_hook(service, hook, cls, name):
     for x in range(5, -1, -1):
         f = _get_func(cls, name, x)
@@ -138,7 +340,7 @@ def _load_hook(service, hook, cls, name):
     )
 
 
-def _load_module_hooks(service, hooks, module, func):
+def _get_hooks(service, module, func):
     service.debug(
         f'[loader/m]: Module "{module.__name__}" loaded, getting Hook information..'
     )
@@ -149,15 +351,21 @@ def _load_module_hooks(service, hooks, module, func):
             f'[loader/m]: Cannot read module "{module.__name__}" ({func})!', err
         )
     if e is None:
-        del e
-        return service.debug(
+        service.debug(
             f'[loader/m]: Module "{module.__name__}" ({func}) did not return any Hooks!'
         )
+        return dict()
     if not isinstance(e, dict):
         return service.error(
             f'[loader/m]: Module "{module.__name__}" "{func}" function returned an invalid '
             f"object type ({type(e)}) it must be a dict!"
         )
+    return e
+
+
+def _load_module_hooks(service, hooks, module, e):
+    if len(e) == 0:
+        return
     service.debug(
         f'[loader/m]: Module "{module.__name__}" exposed the following ({len(e)}) hooks: {_hooks_to_str(e)}.'
     )
@@ -186,6 +394,39 @@ def _load_module_hooks(service, hooks, module, func):
     service.debug(f'[loader/m]: Module "{module.__name__}" loaded.')
 
 
+def _load_worker(service, hooks, name, e):
+    service.debug(
+        f'[loader/w]: Module "{name}" is isolated, getting Hook information..'
+    )
+    if len(e) == 0:
+        return service.debug(
+            f'[loader/w]: Module "{name}" (hooks_server) did not return any Hooks!'
+        )
+    w = WorkerHost(service, name)
+    r = RemoteHook(w)
+    # NOTE(dij): Daemon, startup and shutdown Hooks run inside the worker. Reload
+    #            is passed along so the worker re-reads the configuration.
+    for h in (*e, HOOK_RELOAD):
+        if h in (HOOK_DAEMON, HOOK_STARTUP, HOOK_SHUTDOWN, HOOK_HANDOFF):
+            continue
+        if h not in hooks:
+            hooks[h] = HookList()
+        if r not in hooks[h]:
+            hooks[h].append(r)
+    # NOTE(dij): Workers are stopped on a restart handoff too, the new Server
+    #            starts its own.
+    for h in (HOOK_SHUTDOWN, HOOK_HANDOFF):
+        if h not in hooks:
+            hooks[h] = HookList()
+        hooks[h].append(Hook(w, w.stop, WorkerHost))
+    service.debug(
+        f'[loader/w]: Module "{name}" exposed the following ({len(e)}) hooks: '
+        f'[{", ".join(f"0x{i:02X}" for i in e)}].'
+    )
+    w.start()
+    del w, r, e
+
+
 def _load_hook_obj(service, loaded, hook, cls, name):
     x = name.find(".")
     if x < 1 or x + 1 >= len(name):
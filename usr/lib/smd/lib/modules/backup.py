@@ -40,7 +40,7 @@
 
 from glob import glob
 from shutil import rmtree
-from threading import Event
+from threading import Event, Lock
 from uuid import uuid4, UUID
 from base64 import b64encode
 from typing import NamedTuple
@@ -73,6 +73,7 @@ from lib.constants.config import (
 from lib.constants import (
     EMPTY,
     MSG_PRE,
+    STATUS_BACKUP,
     NEWLINE,
     MSG_USER,
     MSG_POST,
@@ -1840,9 +1841,10 @@ class Single(NamedTuple):
 
 
 class BackupServer(object):
-    __slots__ = ("_queue", "_current")
+    __slots__ = ("_lock", "_queue", "_current")
 
     def __init__(self):
+        self._lock = Lock()
         self._queue = Queue()
         self._current = None
 
@@ -1859,8 +1861,17 @@ class BackupServer(object):
         return {"plans": r}
 
     def hook(self, server, message):
-        if self._current is None or not self._current.running():
-            return
+        # NOTE(dij): The lock is held as deferred stops change "_current"
+        #            outside of the Backup lane.
+        with self._lock:
+            if self._current is None or not self._current.running():
+                return
+            try:
+                self._hook(server, message)
+            finally:
+                self._publish(server)
+
+    def _hook(self, server, message):
         if message.header() == HOOK_SHUTDOWN:
             server.info(f"[m/backup]: Stopping Backup {self._current} due to shutdown.")
             self._current.stop(server)
@@ -1878,8 +1889,23 @@ class BackupServer(object):
             self._current.suspend(server)
 
     def control(self, server, message):
-        if message.type == MSG_STATUS:
-            return self._status(server)
+        with self._lock:
+            if message.type == MSG_STATUS:
+                return self._status(server)
+            try:
+                return self._control(server, message)
+            finally:
+                self._publish(server)
+
+    def _publish(self, server):
+        # NOTE(dij): Publish the Plan status after anything that could change
+        #            it, so status readers don't have to ask for it.
+        r = self._status(server)
+        if isinstance(r, dict):
+            server.publish(STATUS_BACKUP, r)
+        del r
+
+    def _control(self, server, message):
         if message.is_forward(uid=0):
             if message.type != MSG_UPDATE or self._current is None:
                 return
@@ -1943,10 +1969,19 @@ class BackupServer(object):
             if message.action == MSG_PRE:
                 return self._select(server, message.dir, message.force, message.full)
             if message.action == MSG_POST:
-                return self._stop(server, message.dir)
+                # NOTE(dij): Stopping waits on the running processes and the
+                #            cleanup, reply when it's done.
+                return server.defer(self._stop, (server, message.dir))
         return as_error("unknown/invalid backup command")
 
     def _stop(self, server, path=None):
+        with self._lock:
+            try:
+                return self._stop_backup(server, path)
+            finally:
+                self._publish(server)
+
+    def _stop_backup(self, server, path):
         if not nes(path) and (self._current is None or not self._current.running()):
             return {"result": "There is no Backup running."}
         if not nes(path):
@@ -40,6 +40,7 @@
 from uuid import uuid4
 from grp import getgrgid
 from shutil import rmtree
+from threading import Lock
 from random import randint
 from ipaddress import IPv4Network
 from collections import namedtuple
@@ -81,6 +82,7 @@ from lib.constants.config import (
 from lib.constants import (
     MSG_PRE,
     NEWLINE,
+    STATUS_HYDRA,
     HYDRA_TAP,
     HOOK_HYDRA,
     HYDRA_WAKE,
@@ -1558,14 +1560,33 @@ class VM(Storage):
 
 
 class HydraServer(object):
-    __slots__ = ("_vms", "_dns", "_usb", "_pages", "_running")
+    __slots__ = (
+        "_vms",
+        "_dns",
+        "_usb",
+        "_lock",
+        "_pages",
+        "_running",
+        "_published",
+    )
 
     def __init__(self):
         self._vms = dict()
         self._dns = None
+        self._lock = Lock()
         self._usb = dict()
         self._pages = dict()
         self._running = False
+        self._published = None
+
+    def _publish(self, server):
+        # NOTE(dij): Only write the snapshot when a VM changed, as this runs
+        #            on every daemon tick.
+        r = [vm._status() for vm in self._vms.values()]
+        if r == self._published:
+            return
+        server.publish(STATUS_HYDRA, {"vms": r})
+        self._published = r
 
     def start(self, server):
         if self._running:
@@ -1734,9 +1755,24 @@ class HydraServer(object):
         server.info("[m/hydra]: Startup complete.")
 
     def thread(self, server):
+        # NOTE(dij): A Hook (or "_all") holding the lock can take a while, so
+        #            skip this tick instead of holding up the other daemons.
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            return self._thread(server)
+        finally:
+            try:
+                self._publish(server)
+            finally:
+                self._lock.release()
+
+    def _thread(self, server):
         if not self._running:
+            # NOTE(dij): Nothing to do until a VM is started, which sends us a
+            #            Message and brings us back to the normal interval.
             if len(self._vms) == 0:
-                return
+                return False
             server.debug("[m/hydra]: Starting Hydra for pending VMs..")
             self.start(server)
             if self._running:
@@ -1803,7 +1839,53 @@ class HydraServer(object):
             server.debug("[m/hydra]: Shutdown complete.")
         self._running = False
 
+    def _all(self, server, message):
+        # NOTE(dij): This runs deferred on the executer pool, so it needs the
+        #            lock like the Hooks and the daemon.
+        with self._lock:
+            return self._all_vms(server, message)
+
+    def _all_vms(self, server, message):
+        for i in list(self._vms.values()):
+            if not i._running():
+                continue
+            try:
+                if message.type == HYDRA_STOP:
+                    i._stop(server, self, message.force)
+                elif message.type == HYDRA_WAKE or message.type == HYDRA_SLEEP:
+                    i._sleep(server, message.type == HYDRA_SLEEP)
+                elif message.type == HYDRA_HIBERNATE:
+                    i._hibernate(server)
+                elif message.type == HYDRA_RESTART:
+                    i._restart(server, message.force)
+            except Error as err:
+                if message.type == HYDRA_STOP:
+                    server.error(
+                        f"[m/hydra/VM({i.vmid})]: Cannot stop the VM!", err
+                    )
+                elif message.type == HYDRA_WAKE:
+                    server.error(
+                        f"[m/hydra/VM({i.vmid})]: Cannot resume the VM!", err
+                    )
+                elif message.type == HYDRA_SLEEP:
+                    server.error(
+                        f"[m/hydra/VM({i.vmid})]: Cannot suspend the VM!", err
+                    )
+                elif message.type == HYDRA_HIBERNATE:
+                    server.error(
+                        f"[m/hydra/VM({i.vmid})]: Cannot hibernate the VM!", err
+                    )
+                elif message.type == HYDRA_RESTART:
+                    server.error(
+                        f"[m/hydra/VM({i.vmid})]: Cannot restart/reset the VM!", err
+                    )
+        return {"vms": [vm._status() for vm in self._vms.values()]}
+
     def hook(self, server, message):
+        with self._lock:
+            return self._hook(server, message)
+
+    def _hook(self, server, message):
         if message.header() == HOOK_SHUTDOWN:
             return self.stop(server, False)
         if not isinstance(message.type, int):
@@ -1813,40 +1895,9 @@ class HydraServer(object):
         if message.user and message.type == HYDRA_USER_DIRECTORY:
             return message.multicast()
         if message.all:
-            for i in self._vms.values():
-                if not i._running():
-                    continue
-                try:
-                    if message.type == HYDRA_STOP:
-                        i._stop(server, self, message.force)
-                    elif message.type == HYDRA_WAKE or message.type == HYDRA_SLEEP:
-                        i._sleep(server, message.type == HYDRA_SLEEP)
-                    elif message.type == HYDRA_HIBERNATE:
-                        i._hibernate(server)
-                    elif message.type == HYDRA_RESTART:
-                        i._restart(server, message.force)
-                except Error as err:
-                    if message.type == HYDRA_STOP:
-                        server.error(
-                            f"[m/hydra/VM({i.vmid})]: Cannot stop the VM!", err
-                        )
-                    elif message.type == HYDRA_WAKE:
-                        server.error(
-                            f"[m/hydra/VM({i.vmid})]: Cannot resume the VM!", err
-                        )
-                    elif message.type == HYDRA_SLEEP:
-                        server.error(
-                            f"[m/hydra/VM({i.vmid})]: Cannot suspend the VM!", err
-                        )
-                    elif message.type == HYDRA_HIBERNATE:
-                        server.error(
-                            f"[m/hydra/VM({i.vmid})]: Cannot hibernate the VM!", err
-                        )
-                    elif message.type == HYDRA_RESTART:
-                        server.error(
-                            f"[m/hydra/VM({i.vmid})]: Cannot restart/reset the VM!", err
-                        )
-            return {"vms": [vm._status() for vm in self._vms.values()]}
+            # NOTE(dij): Acting on every VM can take a long time, so reply once
+            #            it's done instead of holding up the Hook.
+            return server.defer(self._all, (server, message))
         try:
             x, i = self._get_vm(server, message)
         except Error as err:
@@ -1985,6 +2036,10 @@ class HydraServer(object):
         return v, True
 
     def hibernate(self, server, message):
+        with self._lock:
+            self._sleep_vms(server, message)
+
+    def _sleep_vms(self, server, message):
         if message.type != MSG_PRE or len(self._vms) == 0:
             return
         server.info("[m/hydra]: Suspending VMS for due to Hibernation/Suspend!")
@@ -53,6 +53,7 @@ from lib.util import boolean, num, nes, cancel_nul, seconds, time_to_str
 from lib.constants import (
     EMPTY,
     HOOK_OK,
+    STATUS_LOCKER,
     NEWLINE,
     MSG_PRE,
     MSG_POST,
@@ -66,6 +67,7 @@ from lib.constants import (
     HOOK_DAEMON,
     HOOK_RELOAD,
     TRIGGER_KEY,
+    HOOK_HANDOFF,
     TRIGGER_LOCK,
     HOOK_MONITOR,
     HOOK_STARTUP,
@@ -128,7 +130,9 @@ HOOKS_SERVER = {
     HOOK_DAEMON: "LockerServer.thread",
     HOOK_LOCKER: "LockerServer.update",
     HOOK_RELOAD: "LockerServer.reload",
+    HOOK_HANDOFF: "LockerServer.handoff",
     HOOK_MONITOR: "LockerServer.screen",
+    HOOK_STARTUP: "LockerServer.restore",
     HOOK_SUSPEND: "LockerServer.suspend",
     HOOK_SHUTDOWN: "LockerServer.shutdown",
     HOOK_HIBERNATE: "LockerServer.hibernate",
@@ -836,6 +840,7 @@ class LockerServer(object):
         "_lid_path",
         "_displays",
         "_wake_alarm",
+        "_published",
         "_suspending",
         "_hibernating",
     )
@@ -849,6 +854,7 @@ class LockerServer(object):
         self._displays = False
         self._lid_path = None
         self._wake_alarm = False
+        self._published = None
         self._suspending = False
         self._hibernating = False
 
@@ -857,8 +863,18 @@ class LockerServer(object):
 
     def thread(self, server):
         self._notify(server)
+        self._publish(server)
         self._lid_check(server)
 
+    def _publish(self, server):
+        # NOTE(dij): The status also has the client abilities, so this runs on
+        #            any change and not just the ones the clients are told about.
+        r = self._ability.status(self._lockers)
+        if r == self._published:
+            return
+        server.publish(STATUS_LOCKER, {"lockers": r})
+        self._published = r
+
     def _notify(self, server):
         if not self._update:
             return
@@ -899,6 +915,42 @@ class LockerServer(object):
             pass
         self._lid = None
 
+    def handoff(self, server):
+        # NOTE(dij): Lockers keep the time they have left, their timers are
+        #            created again by the new Server.
+        v = seconds()
+        r = {
+            "ability": self._ability.to_dict(),
+            "lockers": {
+                n: None if l.expire is None else max(l.expire - v, 1)
+                for n, l in self._lockers.items()
+            },
+            "wake_alarm": self._wake_alarm,
+        }
+        del v
+        return r
+
+    def restore(self, server, message):
+        h = message.get("handoff")
+        if not isinstance(h, dict) or not isinstance(h.get(__name__), dict):
+            return
+        d = h[__name__]
+        del h
+        if isinstance(d.get("ability"), dict):
+            self._ability.from_dict(d["ability"])
+        self._wake_alarm = boolean(d.get("wake_alarm", False))
+        if not isinstance(d.get("lockers"), dict):
+            return
+        for n, e in d["lockers"].items():
+            try:
+                self._locker_add(server, n, e, True)
+            except ValueError as err:
+                server.error(f'[m/locker]: Cannot restore the Locker "{n}"!', err)
+        server.debug(
+            f"[m/locker]: Restored {len(self._lockers)} Lockers from the restart."
+        )
+        del d
+
     def _wake_set(self, server):
         if not self._ability.can_hibernate():
             return server.info(
@@ -1056,6 +1108,7 @@ class LockerServer(object):
             server.debug(
                 f"[m/locker]: Updated client capabilities. {self._ability.to_dict()}"
             )
+            self._publish(server)
             if message.type == MSG_CONFIG:
                 return
         if message.type == MSG_UPDATE or message.type == MSG_STATUS:
@@ -1094,6 +1147,7 @@ class LockerServer(object):
             self._locker_close(server, i, False, False)
         self._lockers.clear()
         self._update = False
+        self._publish(server)
         self.shutdown(server)
         self.setup_server(server)
 
@@ -1311,6 +1365,7 @@ class LockerServer(object):
                 f'[m/locker]: Added a Locker "{name}" with a timeout of "{e}" seconds.'
             )
         self._lockers[name] = Locker(server, self, name, e)
+        self._publish(server)
         # NOTE(dij): We don't notify for Backup Lockers
         if name != LOCKER_TYPE_BACKUP:
             self._update = True
@@ -1321,6 +1376,7 @@ class LockerServer(object):
             self._lockers.pop(locker.name, None)
         server.debug(f'[m/locker]: Removed Locker "{locker.name}"!')
         locker.event, locker.expire = cancel_nul(server, locker.event), None
+        self._publish(server)
         # NOTE(dij): We don't notify for Backup Lockers
         if not notify or locker.name == LOCKER_TYPE_BACKUP:
             return
@@ -106,7 +106,10 @@ class Waybar(object):
         if self._reload:
             stop(self._proc)
             self._proc = None
-        if self._errors <= 0 or (self._proc is not None and self._proc.poll() is None):
+        if self._errors <= 0:
+            # NOTE(dij): Out of restarts, wait for a reload.
+            return False
+        if self._proc is not None and self._proc.poll() is None:
             return
         self._exec(server)
 
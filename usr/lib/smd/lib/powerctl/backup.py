@@ -40,7 +40,7 @@
 from lib.util import nes
 from datetime import datetime
 from lib.constants.config import TIMEOUT_SEC_MESSAGE
-from lib import print_error, send_message, check_error
+from lib import Message, read_status, print_error, send_message, check_error
 from lib.constants import (
     EMPTY,
     MSG_PRE,
@@ -50,6 +50,7 @@ from lib.constants import (
     MSG_CONFIG,
     MSG_ACTION,
     HOOK_BACKUP,
+    STATUS_BACKUP,
 )
 
 
@@ -88,14 +89,18 @@ def config(args):
 
 
 def default(args):
+    s = read_status(STATUS_BACKUP)
     try:
-        r = send_message(
-            args.socket,
-            HOOK_BACKUP,
-            HOOK_BACKUP,
-            TIMEOUT_SEC_MESSAGE,
-            {"type": MSG_STATUS},
-        )
+        if isinstance(s, dict):
+            r = Message(HOOK_BACKUP, s)
+        else:
+            r = send_message(
+                args.socket,
+                HOOK_BACKUP,
+                HOOK_BACKUP,
+                TIMEOUT_SEC_MESSAGE,
+                {"type": MSG_STATUS},
+            )
     except Exception as err:
         return print_error("Cannot retrive Backup Plans!", err)
     check_error(r, "Cannot retrive Backup Plans")
@@ -43,7 +43,7 @@ from os.path import basename
 from lib.util import nes, num
 from lib.util.file import read_json, expand
 from lib.shared.hydra import load_vm, get_devices
-from lib import print_error, send_message, check_error
+from lib import Message, read_status, print_error, send_message, check_error
 from lib.constants import (
     EMPTY,
     HYDRA_TAP,
@@ -54,6 +54,7 @@ from lib.constants import (
     HYDRA_SLEEP,
     HYDRA_START,
     HYDRA_STATUS,
+    STATUS_HYDRA,
     HYDRA_RESTART,
     HYDRA_GA_PING,
     HYDRA_USB_ADD,
@@ -541,14 +542,18 @@ def default(args):
 
 
 def vm_list(args):
+    s = read_status(STATUS_HYDRA)
     try:
-        r = send_message(
-            args.socket,
-            HOOK_HYDRA,
-            (HOOK_HYDRA, "vms"),
-            TIMEOUT_SEC_MESSAGE,
-            {"type": HYDRA_STATUS},
-        )
+        if isinstance(s, dict):
+            r = Message(HOOK_HYDRA, s)
+        else:
+            r = send_message(
+                args.socket,
+                HOOK_HYDRA,
+                (HOOK_HYDRA, "vms"),
+                TIMEOUT_SEC_MESSAGE,
+                {"type": HYDRA_STATUS},
+            )
     except Exception as err:
         return print_error("Cannot retrive the VM list!", err)
     check_error(r, "Cannot retrive the VM list!")
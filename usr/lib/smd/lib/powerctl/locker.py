@@ -40,12 +40,13 @@
 
 from lib.shared.locker import pase_locker
 from lib.util import time_to_str, seconds
-from lib import send_message, print_error, check_error
+from lib import Message, read_status, send_message, print_error, check_error
 from lib.constants.config import LOCKER_TYPE_NAMES, TIMEOUT_SEC_MESSAGE
 from lib.constants import (
     MSG_STATUS,
     MSG_ACTION,
     HOOK_LOCKER,
+    STATUS_LOCKER,
     LOCKER_TYPE_LID,
     LOCKER_TYPE_KEY,
     LOCKER_TYPE_LOCK,
@@ -100,14 +101,18 @@ def config(args):
 
 
 def default(args):
+    s = read_status(STATUS_LOCKER)
     try:
-        r = send_message(
-            args.socket,
-            HOOK_LOCKER,
-            (HOOK_LOCKER, "lockers"),
-            TIMEOUT_SEC_MESSAGE,
-            {"type": MSG_STATUS},
-        )
+        if isinstance(s, dict):
+            r = Message(HOOK_LOCKER, s)
+        else:
+            r = send_message(
+                args.socket,
+                HOOK_LOCKER,
+                (HOOK_LOCKER, "lockers"),
+                TIMEOUT_SEC_MESSAGE,
+                {"type": MSG_STATUS},
+            )
     except Exception as err:
         return print_error("Cannot retrive Lockers!", err)
     check_error(r, "Cannot retrive Lockers")
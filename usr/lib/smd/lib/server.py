@@ -39,13 +39,37 @@
 #   executed by SMD.
 
 from grp import getgrnam
-from threading import Event
+from itertools import count
+from json import dumps, loads
+from collections import deque
+from threading import Event, Lock
+from signal import signal, SIGUSR2
 from os.path import exists, dirname
 from lib.util.file import ensure_dir
+from sys import executable, orig_argv
+from lib.structs.loop import AsyncPoll
+from base64 import b64decode, b64encode
 from lib.structs import Service, Message
-from os import remove, chmod, chown, stat
-from select import epoll, EPOLLERR, EPOLLHUP, EPOLLIN
-from lib.constants import VERSION, HOOK_SHUTDOWN, HOOK_NOTIFICATION
+from lib.structs.status import clear_status
+from lib.structs.message import CODEC_JSON, Reader, negotiate
+from select import epoll, EPOLLERR, EPOLLHUP, EPOLLIN, EPOLLOUT
+from lib.constants import VERSION, HOOK_HELLO, HOOK_SHUTDOWN, HOOK_NOTIFICATION
+from os import (
+    stat,
+    chmod,
+    chown,
+    close,
+    execv,
+    remove,
+    getpid,
+    environ,
+    eventfd,
+    EFD_CLOEXEC,
+    eventfd_read,
+    EFD_NONBLOCK,
+    eventfd_write,
+    set_inheritable,
+)
 from socket import (
     socket,
     AF_UNIX,
@@ -56,22 +80,71 @@ from socket import (
     SO_REUSEADDR,
 )
 from lib.constants.config import (
+    CORE_ASYNC,
     NAME_SERVER,
     LOG_PAYLOAD,
     SOCKET_GROUP,
+    SOCKET_ROUTES,
     SOCKET_BACKLOG,
+    SOCKET_IOV_MAX,
     TIMEOUT_SEC_STOP,
+    SOCKET_QUEUE_SIZE,
     DIRECTORY_MODULES,
+    SOCKET_QUEUE_POLICY,
 )
 
 
+_ROUTE = 0x80000000
+_HANDOFF = "SMD_HANDOFF"
+_LISTEN_FDS_START = 3
+
+
+def _listen_fd():
+    # NOTE(dij): systemd socket activation passes the listening socket as the
+    #            first fd after stderr. The variables are removed so they are not
+    #            passed on to any child processes.
+    p, n = environ.pop("LISTEN_PID", None), environ.pop("LISTEN_FDS", None)
+    environ.pop("LISTEN_FDNAMES", None)
+    try:
+        if p is None or int(p) != getpid() or int(n) < 1:
+            return None
+    except (TypeError, ValueError):
+        return None
+    finally:
+        del p, n
+    return _LISTEN_FDS_START
+
+
 class Conn(object):
-    __slots__ = ("_uid", "_pid", "_sock", "_queue")
+    __slots__ = (
+        "_fd",
+        "_uid",
+        "_hooks",
+        "_pid",
+        "_out",
+        "_lock",
+        "_poll",
+        "_sock",
+        "_dead",
+        "_armed",
+        "_codec",
+        "_queue",
+        "_reader",
+        "_dropped",
+    )
 
-    def __init__(self, sock):
+    def __init__(self, sock, poll):
         self._sock = sock
         self._sock.setblocking(False)
-        self._queue = list()
+        self._fd = sock.fileno()
+        self._out = list()
+        self._poll = poll
+        self._lock = Lock()
+        self._queue = deque()
+        self._hooks = None
+        self._codec = CODEC_JSON
+        self._reader = Reader()
+        self._dead, self._armed, self._dropped = False, False, 0
         try:
             self._pid = int(self._sock.getsockopt(SOL_SOCKET, SO_PEERCRED))
             self._uid = stat(f"/proc/{self._pid}").st_uid
@@ -79,88 +152,230 @@ class Conn(object):
             self._pid, self._uid = None, None
 
     def read(self):
-        self._sock.setblocking(True)
-        try:
-            return Message(stream=self._sock, pid=self._pid, uid=self._uid)
-        finally:
-            self._sock.setblocking(False)
+        return self._reader.read(self._sock, self._pid, self._uid)
 
     def close(self):
         if self._sock is None:
             return
-        self._sock.shutdown(SHUT_RDWR)
-        self._sock.close()
-        self._queue.clear()
-        self._sock, self._queue, self._uid, self._pid = None, None, None, None
+        with self._lock:
+            self._sock.shutdown(SHUT_RDWR)
+            self._sock.close()
+            self._out.clear()
+            self._queue.clear()
+            self._sock, self._uid, self._pid, self._reader = None, None, None, None
 
-    def add(self, message):
-        if self._sock is None:
-            return
-        self._queue.append(message)
-
-    def flush(self, server):
-        if self._sock is None or self._queue is None:
+    def _arm(self, out):
+        # NOTE(dij): Only called with the lock held.
+        if self._armed == out or self._sock is None:
             return
         try:
-            while len(self._queue) > 0:
-                self._flush(server)
-        except (TypeError, AttributeError):
-            # NOTE(dij): Catch race condition that happens when a client disconnects
-            #            during a flush operation.
+            self._poll.modify(self._fd, EPOLLIN | EPOLLOUT if out else EPOLLIN)
+            self._armed = out
+        except (OSError, ValueError):
             pass
 
-    def _flush(self, server):
-        m = self._queue.pop()
-        m["server_pid"] = server._pid
-        try:
-            m.send(self._sock)
+    def is_dead(self):
+        return self._dead
+
+    def handoff(self, server):
+        # NOTE(dij): Anything not yet written or only partly read is kept, so
+        #            no messages are lost over a restart.
+        self.flush(server)
+        with self._lock:
+            w = b"".join(self._out) + b"".join(b"".join(i) for i in self._queue)
+            r = {
+                "fd": self._fd,
+                "codec": self._codec,
+                "hooks": None if self._hooks is None else list(self._hooks),
+                "read": b64encode(self._reader.buffered()).decode("UTF-8"),
+                "write": b64encode(w).decode("UTF-8"),
+            }
+            del w
+        set_inheritable(self._fd, True)
+        return r
+
+    def restore(self, server, state):
+        self._codec = state.get("codec", CODEC_JSON)
+        if isinstance(state.get("hooks"), list):
+            self._hooks = frozenset(state["hooks"])
+        w = b64decode(state.get("write", ""))
+        if len(w) > 0:
+            with self._lock:
+                self._queue.append((w,))
+                self._arm(True)
+        del w
+        return self._reader.feed(b64decode(state.get("read", "")), self._pid, self._uid)
+
+    def wants(self, header):
+        return self._hooks is None or header in self._hooks
+
+    def hello(self, server, message):
+        self._codec = negotiate(message.get("codecs"))
+        server.debug(
+            f'[conn]: Socket FD({self._fd}) negotiated the "{self._codec}" codec.'
+        )
+        # NOTE(dij): Clients that don't list their Hooks (powerctl and older
+        #            clients) get every broadcast.
+        h = message.get("hooks")
+        if isinstance(h, list):
+            self._hooks = frozenset(i for i in h if isinstance(i, int))
             server.debug(
-                f"[conn]: Message 0x{m.header():02X} was sent to socket FD({self._sock.fileno()})."
+                f"[conn]: Socket FD({self._fd}) subscribed to {len(self._hooks)} Hook(s)."
             )
-            if LOG_PAYLOAD:
-                server.error(f"[dump]: OUT > {m}")
-        except OSError as err:
-            if err.errno == 0x20 or err.errno == 0x9:
-                if self._sock.fileno() == -1:
-                    return
-                return server.debug(
-                    f"[conn]: Socket FD({self._sock.fileno()}) has disconnected!"
+        del h
+        self.add(
+            server, Message(HOOK_HELLO, {"codec": self._codec, "server_pid": server._pid})
+        )
+
+    def add(self, server, message, frames=None, cid=None):
+        if self._sock is None or self._dead:
+            return
+        # NOTE(dij): "frames" is a cache of encoded frames by codec that is shared
+        #            between connections, so a broadcast is only encoded once
+        #            for each codec in use instead of once per connection.
+        f = None if frames is None else frames.get(self._codec)
+        if f is None:
+            try:
+                f = message.frame(self._codec, cid)
+            except (OSError, ConnectionError) as err:
+                return server.error(
+                    f"[conn]: Cannot encode message 0x{message.header():02X} for socket FD({self._fd})!",
+                    err,
                 )
-            server.error(
-                f"[conn]: Cannot send message 0x{m.header():02X} to socket FD({self._sock.fileno()})!",
-                err,
-            )
-        except Exception as err:
-            server.error(
-                f"[conn]: Cannot send message 0x{m.header():02X} to socket FD({self._sock.fileno()})!",
-                err,
-            )
-        finally:
-            del m
+            if frames is not None:
+                frames[self._codec] = f
+        with self._lock:
+            if self._sock is None:
+                return
+            if len(self._queue) >= SOCKET_QUEUE_SIZE:
+                if SOCKET_QUEUE_POLICY == "disconnect":
+                    self._dead = True
+                    server.warning(
+                        f"[conn]: Socket FD({self._fd}) outbound queue is full, disconnecting it!"
+                    )
+                    # NOTE(dij): Arm the socket so the poll loop wakes up and
+                    #            closes it.
+                    return self._arm(True)
+                self._queue.popleft()
+                self._dropped += 1
+                if self._dropped == 1 or self._dropped % SOCKET_QUEUE_SIZE == 0:
+                    server.warning(
+                        f"[conn]: Socket FD({self._fd}) is not keeping up, dropped "
+                        f"{self._dropped} message(s)!"
+                    )
+            self._queue.append(f)
+            self._arm(True)
+        del f
 
-    def setblocking(self, blocking):
-        self._sock.setblocking(blocking)
+    def flush(self, server):
+        if self._sock is None or self._dead:
+            return False
+        with self._lock:
+            # NOTE(dij): Coalesce as many queued frames into a single writev
+            #            call as we can. A chunked frame may have more chunks
+            #            than SOCKET_IOV_MAX, so "_out" can be longer than what
+            #            we send and keeps the part of it that is not sent yet.
+            while len(self._queue) > 0 and len(self._out) < SOCKET_IOV_MAX:
+                for i in self._queue.popleft():
+                    if len(i) > 0:
+                        self._out.append(memoryview(i))
+            if len(self._out) == 0:
+                self._arm(False)
+                return True
+            try:
+                n = self._sock.sendmsg(self._out[:SOCKET_IOV_MAX])
+            except (BlockingIOError, InterruptedError):
+                return True
+            except OSError as err:
+                if err.errno != 0x20 and err.errno != 0x9 and err.errno != 0x68:
+                    server.error(f"[conn]: Cannot write to socket FD({self._fd})!", err)
+                else:
+                    server.debug(f"[conn]: Socket FD({self._fd}) has disconnected!")
+                return False
+            x = 0
+            while n > 0:
+                if n < len(self._out[x]):
+                    self._out[x] = self._out[x][n:]
+                    break
+                n -= len(self._out[x])
+                x += 1
+            del self._out[:x]
+            if len(self._out) == 0 and len(self._queue) == 0:
+                self._arm(False)
+            del n, x
+        return True
 
 
 class Server(Service):
-    __slots__ = ("_path", "_socket", "_clients", "_running", "_complete")
+    __slots__ = (
+        "_seq",
+        "_path",
+        "_lock",
+        "_wake",
+        "_conns",
+        "_routes",
+        "_socket",
+        "_clients",
+        "_running",
+        "_restart",
+        "_handoff",
+        "_complete",
+        "_activated",
+    )
 
     def __init__(self, config, sock, level, log, read_only, journal):
         Service.__init__(
             self, NAME_SERVER, DIRECTORY_MODULES, config, level, log, read_only, journal
         )
+        self._seq = count(1)
         self._path = sock
+        self._lock = Lock()
         self._socket = None
+        self._conns = tuple()
+        self._routes = dict()
         self._clients = dict()
         self._running = Event()
         self._complete = Event()
+        self._wake, self._restart, self._activated = None, False, False
+        # NOTE(dij): Set when we were started by "restart", this is the state
+        #            that the previous Server handed off.
+        try:
+            self._handoff = loads(environ.pop(_HANDOFF, "null"))
+        except ValueError as err:
+            self.error("[main]: Cannot read the restart handoff state!", err)
+            self._handoff = None
+        signal(SIGUSR2, self._signal_restart)
 
     def stop(self):
         self._running.set()
+        self._stop_loop()
         self._complete.wait(TIMEOUT_SEC_STOP)
 
+    def restart(self):
+        # NOTE(dij): Re-executes the Server in place. The listening socket and
+        #            client connections are passed to the new image, so clients
+        #            stay connected. Every module is imported again. Modules with
+        #            a handoff Hook keep their state. The others are shut down
+        #            first, so anything they manage (Hydra VMs, running Backups)
+        #            is stopped and does not survive the restart.
+        self.info("[main]: Restarting the System Management Daemon Server..")
+        self._restart = True
+        self._running.set()
+        self._stop_loop()
+        if self._wake is not None:
+            eventfd_write(self._wake, 1)
+
+    def _signal_restart(self, _, __):
+        self.restart()
+
     def start(self):
         self.info(f"[main]: Starting System Management Daemon Server (v{VERSION})..")
+        if self._handoff is not None:
+            return self._run(self._handoff)
+        f = _listen_fd()
+        if f is not None:
+            return self._run_activated(f)
+        del f
         if exists(self._path):
             try:
                 remove(self._path)
@@ -194,11 +409,87 @@ class Server(Service):
             return self.stop()
         finally:
             del g
+        return self._run(None)
+
+    def _run_activated(self, fd):
+        # NOTE(dij): The socket already exists and is listening, so messages
+        #            sent before we are up wait in its backlog. systemd owns the
+        #            socket file, so it is not removed when we stop.
+        try:
+            self._socket = socket(fileno=fd)
+            set_inheritable(fd, False)
+            self._socket.setblocking(False)
+            if self._socket.family != AF_UNIX or self._socket.type != SOCK_STREAM:
+                raise OSError("passed socket is not a unix stream socket")
+            v = self._socket.getsockname()
+            if isinstance(v, str) and len(v) > 0:
+                self._path = v
+            del v
+        except OSError as err:
+            self.error("[main]: Cannot use the socket passed by systemd!", err)
+            self._socket = None
+            return self._stop()
+        self._activated = True
+        try:
+            # NOTE(dij): systemd creates the directory as root, give the socket
+            #            group access to it, like we do when creating it.
+            chown(dirname(self._path), 0, getgrnam(SOCKET_GROUP).gr_gid)
+        except (KeyError, OSError) as err:
+            self.warning(
+                f'[main]: Cannot set the group of the socket directory for "{self._path}"!',
+                err,
+            )
+        self.info(f'[main]: Using socket "{self._path}" passed by systemd.')
+        return self._run(None)
+
+    def _adopt(self, poll, state):
+        self._socket = socket(AF_UNIX, SOCK_STREAM, fileno=state["socket"])
+        set_inheritable(self._socket.fileno(), False)
+        self._socket.setblocking(False)
+        self._activated = state.get("activated", False)
+        self._seq = count(state.get("seq", 1))
+        with self._lock:
+            for i in state.get("routes", list()):
+                self._routes[i[0]] = (i[1], i[2])
+        for i in state.get("conns", list()):
+            try:
+                c = socket(AF_UNIX, SOCK_STREAM, fileno=i["fd"])
+                set_inheritable(c.fileno(), False)
+                poll.register(c.fileno(), EPOLLIN)
+                v = Conn(c, poll)
+                self._clients[c.fileno()] = v
+                for m in v.restore(self, i):
+                    self._dispatcher.add(c.fileno(), m)
+            except (OSError, ValueError, KeyError) as err:
+                self.error("[main]: Cannot restore a client connection!", err)
+        self._conns = tuple(self._clients.values())
+        self.info(
+            f"[main]: Restored the socket and {len(self._conns)} client connection(s) after a restart."
+        )
+
+    def _run(self, handoff):
+        if CORE_ASYNC:
+            self.debug("[main]: Using the asyncio core.")
+            p = AsyncPoll(self._loop, self._poll_async)
+        else:
+            p = epoll()
+        if handoff is not None:
+            try:
+                self._adopt(p, handoff)
+            except (OSError, ValueError, KeyError, TypeError) as err:
+                self.error("[main]: Cannot restore the restart handoff state!", err)
+                p.close()
+                return self._stop()
+            self._dispatcher.restore(handoff.get("modules"))
+        self._handoff = None
         self._dispatcher.start()
-        p = epoll()
+        self._wake = eventfd(0, EFD_CLOEXEC | EFD_NONBLOCK)
+        p.register(self._wake, EPOLLIN)
         p.register(self._socket.fileno(), EPOLLIN | EPOLLHUP | EPOLLERR)
         try:
-            while not self._running.is_set():
+            if CORE_ASYNC:
+                self._loop.run_forever()
+            while not CORE_ASYNC and not self._running.is_set():
                 for f, e in p.poll(None):
                     if not self._poll(p, f, e):
                         break
@@ -214,40 +505,70 @@ class Server(Service):
             self._stop()
         return True
 
+    def _exec(self):
+        d = {
+            "seq": next(self._seq),
+            "socket": self._socket.fileno(),
+            "modules": self._dispatcher.handoff(),
+            "activated": self._activated,
+        }
+        with self._lock:
+            d["routes"] = [(k, v[0], v[1]) for k, v in self._routes.items()]
+        try:
+            d["conns"] = [i.handoff(self) for i in self._conns if not i.is_dead()]
+            set_inheritable(d["socket"], True)
+            environ[_HANDOFF] = dumps(d)
+            self.info(
+                f"[main]: Handing off the socket and {len(d['conns'])} client connection(s).."
+            )
+            execv(executable, orig_argv)
+        except (OSError, ValueError, TypeError) as err:
+            self.error("[main]: Cannot restart the Server, stopping instead!", err)
+        environ.pop(_HANDOFF, None)
+        del d
+
     def _stop(self):
+        if self._restart and self._socket is not None:
+            self._exec()
         self._send_one(None, Message(HOOK_SHUTDOWN))
         self._dispatcher.stop()
+        # NOTE(dij): Nothing updates the status snapshots after this, so clear
+        #            them instead of leaving stale data for readers.
+        clear_status()
         self.info("[main]: Stopping System Management Daemon Server..")
         self._running.set()
-        c = list(self._clients.values())
-        for i in c:
+        for i in self._conns:
+            # NOTE(dij): Make a last attempt to push out anything queued (like
+            #            the shutdown message) before closing.
             try:
+                i.flush(self)
                 i.close()
             except OSError:
                 pass
-        del c
         self._clients.clear()
+        self._conns = tuple()
         try:
             if self._socket is not None:
-                self._socket.shutdown(SHUT_RDWR)
+                # NOTE(dij): A shutdown would also affect the copy held by
+                #            systemd, so just close ours.
+                if not self._activated:
+                    self._socket.shutdown(SHUT_RDWR)
                 self._socket.close()
             self._socket = None
         except OSError as err:
             self.error(f'[main]: Cannot close the socket "{self._path}"!', err)
-        if exists(self._path):
+        if not self._activated and exists(self._path):
             try:
                 remove(self._path)
             except OSError as err:
                 self.error(f'[main]: Cannot remove the socket "{self._path}"!', err)
+        if self._wake is not None:
+            close(self._wake)
+            self._wake = None
+        self._close_loop()
         self.info("[main]: Shutdown complete.")
         self._complete.set()
 
-    def _flush(self):
-        c = list(self._clients.values())
-        for i in c:
-            i.flush(self)
-        del c
-
     def __hash__(self):
         return hash(NAME_SERVER)
 
@@ -255,28 +576,43 @@ class Server(Service):
         return True
 
     def _read(self, poll, file):
+        c = self._clients[file]
         try:
-            m = self._clients[file].read()
-            self._dispatcher.add(file, m)
-            self.debug(
-                f"[conn]: Received Message type 0x{m.header():02X} from client "
-                f"PID({m.pid()})/UID({m.uid()})/FD({file})."
-            )
-            if LOG_PAYLOAD:
-                self.error(f"[dump]:  IN < {m}")
-            del m
+            for m in c.read():
+                if m.header() == HOOK_HELLO:
+                    c.hello(self, m)
+                    continue
+                self._dispatcher.add(file, m)
+                self.debug(
+                    f"[conn]: Received Message type 0x{m.header():02X} from client "
+                    f"PID({m.pid()})/UID({m.uid()})/FD({file})."
+                )
+                if LOG_PAYLOAD:
+                    self.error(f"[dump]:  IN < {m}")
+                del m
             return
         except OSError as err:
             if err.errno != 0x3E8:
-                return self.error(
-                    f"[conn]: Cannot read from client on FD({file})!", err
-                )
+                self.error(f"[conn]: Cannot read from client on FD({file})!", err)
         finally:
-            self._clients[file].setblocking(False)
+            del c
         self.debug(f"[conn]: Client on FD({file}) disconnected!")
-        poll.unregister(file)
-        self._clients[file].close()
-        del self._clients[file]
+        self._remove(poll, file)
+
+    def _remove(self, poll, file):
+        try:
+            poll.unregister(file)
+        except (OSError, ValueError):
+            pass
+        c = self._clients.pop(file, None)
+        if c is None:
+            return
+        self._conns = tuple(self._clients.values())
+        try:
+            c.close()
+        except OSError:
+            pass
+        del c
 
     def send(self, eid, message):
         if isinstance(message, Message):
@@ -288,48 +624,116 @@ class Server(Service):
         for i in message:
             if not isinstance(i, Message):
                 continue
-            self._send_one(eid, i, flush=False)
-        self._flush()
+            self._send_one(eid, i)
 
     def broadcast(self, message):
         self.send(None, message)
 
+    def _poll_async(self, poll, file, event):
+        if not self._poll(poll, file, event) and self._running.is_set():
+            self._loop.stop()
+
     def _poll(self, poll, file, event):
+        if file == self._wake:
+            eventfd_read(self._wake)
+            return False
         if file == self._socket.fileno():
             if event & EPOLLHUP:
                 self.debug("[conn]: Received socket shutdown event.")
                 return self._running.set()
-            c, _ = self._socket.accept()
-            poll.register(c, EPOLLIN)
-            self._clients[c.fileno()] = Conn(c)
-            self.debug(f"[conn]: Client connected on socket FD({c.fileno()}).")
-            del c
+            # NOTE(dij): Drain the whole accept backlog at once, as a burst of
+            #            connections (udev storms) would otherwise take a full
+            #            poll loop each.
+            while True:
+                try:
+                    c, _ = self._socket.accept()
+                except (BlockingIOError, InterruptedError):
+                    break
+                poll.register(c, EPOLLIN)
+                self._clients[c.fileno()] = Conn(c, poll)
+                self.debug(f"[conn]: Client connected on socket FD({c.fileno()}).")
+                del c
+            # NOTE(dij): Broadcasts iterate over this snapshot, so they don't
+            #            need to copy the client list each time.
+            self._conns = tuple(self._clients.values())
             return True
-        if file not in self._clients:
+        c = self._clients.get(file)
+        if c is None:
             return True
-        if event & EPOLLIN:
+        if (event & EPOLLOUT and not c.flush(self)) or c.is_dead():
+            self._remove(poll, file)
+        elif event & EPOLLIN:
             self._read(poll, file)
         elif event & (EPOLLHUP | EPOLLERR):
             self.error(
                 f"[conn]: Client on socket FD({file}) has disconnected with errors!"
             )
-            poll.unregister(file)
-            self._clients[file].close()
-            del self._clients[file]
+            self._remove(poll, file)
+        del c
         return True
 
-    def _send_one(self, eid, message, flush=True):
+    def _route(self, eid, cid):
+        # NOTE(dij): Requests forwarded to the clients get a Server-wide ID with
+        #            the top bit set, so the replies from any client can be sent
+        #            back to the connection that made the request.
+        r = _ROUTE | (next(self._seq) % _ROUTE)
+        with self._lock:
+            self._routes[r] = (eid, cid)
+            while len(self._routes) > SOCKET_ROUTES:
+                del self._routes[next(iter(self._routes))]
+        return r
+
+    def _send_one(self, eid, message):
+        if message.get("server_pid") != self._pid:
+            message["server_pid"] = self._pid
+        x = message.cid()
+        if x is not None and x & _ROUTE:
+            with self._lock:
+                r = self._routes.get(x)
+            c = None if r is None else self._clients.get(r[0])
+            if c is not None:
+                # NOTE(dij): This is a client's reply to a forwarded request.
+                c.add(self, message, cid=r[1])
+                self.debug(
+                    f"[conn]: Message 0x{message.header():02X} was routed to socket FD({r[0]})."
+                )
+                if LOG_PAYLOAD:
+                    self.error(f"[dump]: OUT > {message}")
+                return
+            del r, c
+            x = None
         if eid is None or message.is_multicast():
-            c = list(self._clients.values())
+            c, k = self._conns, None
+            if len(c) == 0:
+                return
+            # NOTE(dij): The requester gets the multicast as its reply, all the
+            #            other connections get it with a new route ID.
+            o = None if x is None or eid is None else self._clients.get(eid)
+            if o is not None:
+                o.add(self, message)
+                k = self._route(eid, x)
+            f, n, h = dict(), 0, message.header()
             for i in c:
-                i.add(message)
-            del c
-        elif eid is not None and eid in self._clients:
-            self._clients[eid].add(message)
+                if (k is not None and i._fd == eid) or not i.wants(h):
+                    continue
+                i.add(self, message, f, k)
+                n += 1
+            self.debug(
+                f"[conn]: Message 0x{h:02X} was queued to {n}/{len(c)} "
+                f"client(s) using {len(f)} encoding(s)."
+            )
+            del c, f, k, o, n, h
         else:
-            return
-        if flush:
-            self._flush()
+            c = self._clients.get(eid)
+            if c is None:
+                return
+            c.add(self, message)
+            self.debug(
+                f"[conn]: Message 0x{message.header():02X} was queued to socket FD({eid})."
+            )
+            del c
+        if LOG_PAYLOAD:
+            self.error(f"[dump]: OUT > {message}")
 
     def notify(self, title, message=None, icon=None):
         self._send_one(
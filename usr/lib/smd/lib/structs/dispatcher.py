@@ -38,34 +38,108 @@
 #   The Dispatcher allows for dynamic and asynchronous calling of various functions
 #   loaded. The Dispatcher also manages the scheduler and any process functions.
 
-from signal import alarm
-from sched import scheduler
-from time import time, sleep
+from time import time
+from json import dumps
+from itertools import count
+from collections import deque
+from lib.util.file import read
 from lib.util.exec import stop
-from threading import Thread, Event
+from select import epoll, EPOLLIN
 from lib.loader import load_modules
 from lib.structs.message import Message
-from lib.constants.config import LOG_LEVEL, TIMEOUT_SEC_STOP, TIMEOUT_SEC_HOOK
+from threading import Thread, Event, Lock
+from lib.structs.watchdog import Watchdog
+from heapq import heapify, heappush, heappop
+from lib.structs.hook import Pending, correlate
+from concurrent.futures import ThreadPoolExecutor
+from os import (
+    close,
+    eventfd,
+    EFD_CLOEXEC,
+    eventfd_read,
+    EFD_NONBLOCK,
+    eventfd_write,
+)
 from lib.constants import (
     HOOK_OK,
     HOOK_LOG,
+    HOOK_POWER,
     HOOK_DAEMON,
     HOOK_RELOAD,
+    HOOK_HANDOFF,
     HOOK_STARTUP,
     HOOK_SHUTDOWN,
 )
+from lib.constants.config import (
+    LOG_LEVEL,
+    DISPATCH_LANES,
+    DISPATCH_SLACK,
+    DISPATCH_BUDGET,
+    DISPATCH_WORKERS,
+    DISPATCH_BARRIER,
+    TIMEOUT_SEC_STOP,
+    TIMEOUT_SEC_HOOK,
+    DISPATCH_INTERVAL,
+    DISPATCH_IDLE_MAX,
+    DISPATCH_PRIORITY,
+    DISPATCH_COALESCE,
+    HOOK_TRANSLATIONS,
+    DISPATCH_SLACK_MAX,
+    DISPATCH_POWER_PATH,
+    DISPATCH_SLACK_BATTERY,
+    DISPATCH_PRIORITY_DEFAULT,
+)
+
+try:
+    from os import pidfd_open
+except ImportError:
+    pidfd_open = None
+
+# NOTE(dij): Cancelled Tasks are left in the heaps and skipped when they come
+#            up (lazy deletion), so cancelling is O(1). The heaps are rebuilt
+#            without them once they are most of it.
+_COMPACT_SIZE = 256
+
+
+def _hook_map(values):
+    # NOTE(dij): Values loaded from the custom config JSON will have string keys
+    #            so convert them to Hook numbers. Names from "HOOK_TRANSLATIONS"
+    #            are also allowed.
+    r = dict()
+    for k, v in values.items():
+        if isinstance(k, str):
+            try:
+                k = HOOK_TRANSLATIONS[k.lower()] if not k.isdigit() else int(k, 10)
+            except (KeyError, ValueError):
+                continue
+        if isinstance(k, int):
+            r[k] = v
+    return r
 
 
 class Dispatcher(Thread):
     __slots__ = (
         "_dir",
+        "_seq",
+        "_lock",
+        "_prio",
+        "_depth",
+        "_barrier",
+        "_pool",
+        "_queued",
+        "_coalesce",
+        "_coalesced",
         "_hooks",
+        "_lanes",
+        "_restore",
+        "_handoff",
         "_service",
         "_running",
         "_waiting",
         "_messages",
         "_complete",
         "_executer",
+        "_watchdog",
     )
 
     def __init__(self, service, directory):
@@ -73,36 +147,71 @@ class Dispatcher(Thread):
         self._dir = directory
         self._hooks = None
         self._service = service
+        self._seq = count()
+        self._lock = Lock()
+        self._prio = _hook_map(DISPATCH_PRIORITY)
+        self._depth = dict()
+        self._pool = None
+        self._queued = dict()
+        self._coalesce = _hook_map(DISPATCH_COALESCE)
+        self._barrier = frozenset(_hook_map({i: None for i in DISPATCH_BARRIER}))
+        self._coalesced = dict()
+        self._lanes = dict()
+        self._restore = None
+        self._handoff = None
         self._running = Event()
         self._waiting = Event()
         self._messages = list()
         self._complete = Event()
         self._executer = DispatchExecuter(service)
+        self._watchdog = Watchdog(
+            service, _hook_map(DISPATCH_BUDGET), TIMEOUT_SEC_HOOK * 1000
+        )
 
     def run(self):
         self._service.debug("[dispatch]: Starting processing Thread..")
+        self._watchdog.start()
         self._service.load()
         self._hooks = load_modules(self._service, self._dir)
         if HOOK_DAEMON in self._hooks:
-            self._executer._hooks = self._hooks[HOOK_DAEMON]
+            self._executer.daemons(self._hooks[HOOK_DAEMON])
             del self._hooks[HOOK_DAEMON]
+        self._service.loaded(list(self._hooks.keys()))
         if HOOK_STARTUP in self._hooks:
             self._service.debug("[dispatch]: Running Startup Hooks..")
-            r = self._hooks[HOOK_STARTUP].run(self._service, Message(HOOK_STARTUP))
+            # NOTE(dij): After a restart, modules get back the state they handed
+            #            off, under their module name.
+            m = Message(
+                HOOK_STARTUP,
+                None if self._restore is None else {"handoff": self._restore},
+            )
+            r = self._hooks[HOOK_STARTUP].run(self._service, m)
             if len(r) > 0:
-                self._service.send(None, r)
-            del r
+                self._reply(None, m, r)
+            del r, m
         self._service.save()
         # NOTE(dij): Don't trigger the daemon until now.
         self._executer.start()
         while not self._running.is_set():
-            if len(self._messages) == 0:
-                self._waiting.clear()
             self._waiting.wait()
-            while len(self._messages) > 0:
-                self._process(self._messages.pop())
+            while True:
+                m = self._next()
+                if m is None:
+                    break
+                self._process(m)
+                del m
         self._service.debug("[dispatch]: Stopping processing Thread..")
-        if HOOK_SHUTDOWN in self._hooks:
+        # NOTE(dij): Let the lanes finish what they have before running the
+        #            shutdown Hooks.
+        for i in self._lanes.values():
+            i.stop()
+        self._lanes.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._handoff is not None:
+            self._run_handoff()
+        elif HOOK_SHUTDOWN in self._hooks:
             self._service.debug("[dispatch]: Running shutdown Hooks..")
             self._hooks[HOOK_SHUTDOWN].run(self._service, Message(HOOK_SHUTDOWN))
         self._service.save()
@@ -114,7 +223,78 @@ class Dispatcher(Thread):
         self._waiting.set()
         self._complete.wait(TIMEOUT_SEC_STOP)
 
+    def handoff(self):
+        # NOTE(dij): Stops like "stop", but runs the handoff Hooks instead of the
+        #            shutdown Hooks and returns the state they gave.
+        self._handoff = dict()
+        self.stop()
+        return self._handoff
+
+    def restore(self, state):
+        self._restore = state if isinstance(state, dict) else None
+
+    def _run_handoff(self):
+        x = self._hooks.get(HOOK_HANDOFF, list())
+        # NOTE(dij): Modules that can't handoff their state (VMs, running
+        #            Backups, etc.) still get their shutdown Hooks, so we don't
+        #            leak any processes into the new image.
+        if HOOK_SHUTDOWN in self._hooks:
+            c = {getattr(h, "_class", None) for h in x}
+            c.discard(None)
+            v = [
+                h
+                for h in self._hooks[HOOK_SHUTDOWN]
+                if getattr(h, "_class", None) not in c
+            ]
+            if len(v) > 0:
+                n = sorted({getattr(h._class, "__name__", str(h)) for h in v})
+                self._service.info(
+                    f"[dispatch]: Stopping modules without handoff Hooks ({', '.join(n)}), "
+                    "anything they manage is stopped."
+                )
+                del n
+                m, q = Message(HOOK_SHUTDOWN), list()
+                for h in v:
+                    h.run(self._service, m, q)
+                del m, q
+            del c, v
+        if len(x) == 0:
+            return
+        self._service.debug("[dispatch]: Running handoff Hooks..")
+        m = Message(HOOK_HANDOFF)
+        for h in x:
+            q = list()
+            h.run(self._service, m, q)
+            for i in q:
+                if not isinstance(i, Message) or i.header() != HOOK_HANDOFF:
+                    continue
+                n = getattr(h._class, "__name__", None)
+                try:
+                    dumps(i._data)
+                except (TypeError, ValueError) as err:
+                    self._service.error(
+                        f'[dispatch/0x{HOOK_HANDOFF:02X}]: Cannot keep the handoff state of "{n}"!',
+                        err,
+                    )
+                    continue
+                self._handoff[n] = i._data
+                del n
+            del q
+        del m, x
+
     def _process(self, msg):
+        # NOTE(dij): A message that doesn't make it to a lane (no Hooks, an
+        #            invalid message or an error) must not stay coalescable, as
+        #            nothing would run anything merged into it.
+        if not self._dispatch(msg):
+            self._forget(msg)
+
+    def _forget(self, msg):
+        with self._lock:
+            if msg.key is not None and self._queued.get(msg.key) is msg:
+                del self._queued[msg.key]
+
+    def _dispatch(self, msg):
         if not msg.is_valid():
             return self._service.warning("[dispatch]: Invalid Message received!")
         if msg.header() == HOOK_LOG:
@@ -125,6 +305,8 @@ class Dispatcher(Thread):
                 )
                 self._service.send(None, msg.data.multicast())
             return
+        if msg.header() == HOOK_POWER:
+            self._executer.power()
         if msg.header() == HOOK_RELOAD:
             self._service.debug(
                 f'[dispatch/0x{msg.header():02X}]: Reloading the configuration "{self._service.config.path()}"..'
@@ -136,60 +318,272 @@ class Dispatcher(Thread):
                     f"[dispatch/0x{msg.header():02X}]: Received an un-hooked request 0x{msg.header():02X}!"
                 )
             return
+        # NOTE(dij): A module getting a Message might have work for its daemon
+        #            Hooks again, so bring any idle ones back to their interval.
+        self._executer.poke(self._hooks[msg.header()])
         try:
             self._service.debug(f"[dispatch/0x{msg.header():02X}]: Running Hooks..")
-            r = self._hooks[msg.header()].run(self._service, msg.data)
-            if len(r) > 0:
-                self._service.send(msg.eid, r)
-            del r
+            if not DISPATCH_LANES:
+                if not self._take(msg):
+                    return True
+                r = self._hooks[msg.header()].run(self._service, msg.data)
+                if len(r) > 0:
+                    self._reply(msg.eid, msg.data, r)
+                del r
+                return True
+            x = self._hooks[msg.header()].lanes()
+            msg.lanes = len(x)
+            # NOTE(dij): Replies for these Hooks are only sent once every lane
+            #            is done, so a suspend isn't answered while another lane
+            #            (ex: hydra) is still getting ready for it.
+            if msg.header() in self._barrier:
+                msg.waiting, msg.replies = len(x), list()
+            for n, v in x.items():
+                if n is None:
+                    self._run_lane(msg, v)
+                else:
+                    self._lane(n).add(self._run_lane, (msg, v))
+            del x
+            return True
         except Exception as err:
             self._service.error(
                 f"[dispatch/0x{msg.header():02X}]: Cannot process request!",
                 err,
             )
 
+    def _lane(self, name):
+        v = self._lanes.get(name)
+        if v is not None:
+            return v
+        self._service.debug(f'[dispatch]: Starting execution lane "{name}"..')
+        v = DispatchLane(self._service, name)
+        v.start()
+        self._lanes[name] = v
+        return v
+
+    def _run_lane(self, msg, hooks):
+        q = list()
+        try:
+            if self._take(msg):
+                for h in hooks:
+                    h.run(self._service, msg.data, q)
+        finally:
+            if msg.replies is not None:
+                q = self._gather(msg, q)
+        if q is not None and len(q) > 0:
+            self._reply(msg.eid, msg.data, q)
+        del q
+
+    def _gather(self, msg, queue):
+        with self._lock:
+            msg.replies.extend(queue)
+            msg.waiting -= 1
+            if msg.waiting > 0 or msg.dropped:
+                return None
+            return msg.replies
+
+    def _reply(self, eid, message, queue):
+        correlate(message, queue)
+        for i in queue:
+            if isinstance(i, Pending):
+                i.bind(self._service, eid, message)
+        self._service.send(eid, queue)
+
+    def _deferred(self, pending, func, args, kwargs):
+        try:
+            r = func(*args, **kwargs)
+        except Exception as err:
+            self._service.error(
+                f'[dispatch/defer]: Deferred function "{func.__name__}" raised an error!',
+                err,
+            )
+            # NOTE(dij): Complete inside the handler so the reply keeps the trace.
+            return pending.complete(err)
+        pending.complete(r)
+        del r
+
+    def track(self, name, header=None):
+        return self._watchdog.track(name, header)
+
+    def defer(self, func, args=(), kwargs={}):
+        p = Pending()
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=DISPATCH_WORKERS, thread_name_prefix="SMD_Deferred"
+            )
+        self._pool.submit(self._deferred, p, func, args, kwargs)
+        return p
+
+    def _next(self):
+        with self._lock:
+            while len(self._messages) > 0:
+                p, _, m = heappop(self._messages)
+                # NOTE(dij): Replaced messages are left in the heap and skipped
+                #            here, as removing them would need a re-heapify.
+                if m.dropped:
+                    continue
+                self._depth[p] -= 1
+                m.popped = True
+                return m
+            self._waiting.clear()
+        return None
+
+    def depth(self):
+        with self._lock:
+            return self._depth.copy()
+
+    def coalesced(self):
+        with self._lock:
+            return self._coalesced.copy()
+
+    def _coalesce_message(self, p, message):
+        # NOTE(dij): Only called with the lock held. Requests that are waiting
+        #            on a reply are never coalesced.
+        c = self._coalesce.get(message.header())
+        if c is None or message.cid() is not None:
+            return None, None
+        k = (message.header(), message.get("type"))
+        try:
+            o = self._queued.get(k)
+        except TypeError:
+            return None, None
+        # NOTE(dij): A lane that already started is reading the data, so don't
+        #            merge into it, queue this one instead.
+        if o is None or (c == "merge" and o.taken):
+            return k, None
+        self._coalesced[k[0]] = self._coalesced.get(k[0], 0) + 1
+        if c == "merge":
+            o.data.update(dict(message.items()))
+            return k, c
+        o.dropped = True
+        # NOTE(dij): It may have already left the heap for a lane queue.
+        if not o.popped:
+            self._depth[p] -= 1
+        return k, c
+
+    def _take(self, msg):
+        # NOTE(dij): Once a message starts running on every lane it can no longer
+        #            be coalesced, so the next one for its Hook and type will be
+        #            queued. Lanes that have not started yet skip a replaced one.
+        with self._lock:
+            if msg.dropped:
+                return False
+            msg.lanes -= 1
+            msg.taken = True
+            if (
+                msg.lanes <= 0
+                and msg.key is not None
+                and self._queued.get(msg.key) is msg
+            ):
+                del self._queued[msg.key]
+        return True
+
     def add(self, eid, message):
         if self._running.is_set():
             return
-        self._messages.append(DispatchMessage(eid, message))
+        # NOTE(dij): Messages are ordered by the priority class of their Hook
+        #            (lower runs first) and then by arrival, so messages in the
+        #            same class stay FIFO.
+        p = self._prio.get(message.header(), DISPATCH_PRIORITY_DEFAULT)
+        with self._lock:
+            k, x = self._coalesce_message(p, message)
+            if x is not None:
+                n = self._coalesced[k[0]]
+            if x != "merge":
+                m = DispatchMessage(eid, message, k)
+                if k is not None:
+                    self._queued[k] = m
+                heappush(self._messages, (p, next(self._seq), m))
+                self._depth[p] = self._depth.get(p, 0) + 1
+                del m
+            d = self._depth[p]
         self._waiting.set()
+        if x is not None:
+            self._service.debug(
+                f"[dispatch/0x{k[0]:02X}]: Coalesced a queued message ({x}, {n} so far)."
+            )
+            del n
+        if d > 1:
+            self._service.debug(
+                f"[dispatch]: Queue depth for priority class {p} is now {d}."
+            )
+        del p, d, k, x
 
     def cancel_task(self, event):
-        if (
-            event is None
-            or self._executer is None
-            or self._executer._sched is None
-            or self._executer._sched.empty()
-        ):
-            return False
-        try:
-            self._executer._sched.cancel(event)
-        except ValueError:
+        if not isinstance(event, DispatchTask) or self._executer is None:
             return False
-        return True
+        return self._executer.cancel(event)
 
     def watch_process(self, proc, func=None, args=(), kwargs={}):
         if proc is None or self._running.is_set():
             return
         if not callable(func):
-            self._executer._watch.append((proc, None, None, None))
+            self._executer.watch((proc, None, None, None))
         else:
-            self._executer._watch.append((proc, func, args, kwargs))
+            self._executer.watch((proc, func, args, kwargs))
 
-    def add_task(self, timeout, func, args=(), kwargs={}, priority=10):
+    def add_task(self, timeout, func, args=(), kwargs={}, priority=10, slack=None):
         if self._running.is_set():
             return
-        if self._executer._sched is None:
-            self._executer._sched = scheduler(timefunc=time, delayfunc=sleep)
-        return self._executer._sched.enter(timeout, priority, func, args, kwargs)
+        return self._executer.add(timeout, func, args, kwargs, priority, slack)
+
+
+class DispatchLane(Thread):
+    __slots__ = ("_queue", "_signal", "_service", "_running")
+
+    def __init__(self, service, name):
+        Thread.__init__(self, name=f"SMD_DispatchLane_{name}", daemon=True)
+        self._queue = deque()
+        self._signal = Event()
+        self._running = Event()
+        self._service = service
+
+    def run(self):
+        while True:
+            self._signal.wait()
+            self._signal.clear()
+            while len(self._queue) > 0:
+                f, a = self._queue.popleft()
+                try:
+                    f(*a)
+                except Exception as err:
+                    self._service.error(
+                        f'[dispatch/lane]: Error in execution lane "{self.name}"!', err
+                    )
+                del f, a
+            if self._running.is_set():
+                break
+
+    def add(self, func, args=()):
+        self._queue.append((func, args))
+        self._signal.set()
+
+    def stop(self):
+        self._running.set()
+        self._signal.set()
+        self.join(TIMEOUT_SEC_STOP)
 
 
 class DispatchMessage(object):
-    __slots__ = ("eid", "data")
+    __slots__ = (
+        "eid",
+        "key",
+        "data",
+        "lanes",
+        "taken",
+        "popped",
+        "replies",
+        "dropped",
+        "waiting",
+    )
 
-    def __init__(self, eid, message):
+    def __init__(self, eid, message, key=None):
         self.eid = eid
+        self.key = key
         self.data = message
+        self.replies, self.waiting = None, 0
+        self.lanes, self.popped, self.dropped = 1, False, False
+        self.taken = False
 
     def header(self):
         return self.data.header()
@@ -198,40 +592,137 @@ class DispatchMessage(object):
         return isinstance(self.data, Message) and isinstance(self.data.header(), int)
 
 
+class DispatchTask(object):
+    __slots__ = ("func", "time", "args", "done", "kwargs", "deadline", "priority")
+
+    def __init__(self, when, slack, priority, func, args, kwargs):
+        self.time, self.deadline, self.done = when, when + slack, False
+        self.func, self.args, self.kwargs, self.priority = func, args, kwargs, priority
+
+    def release(self):
+        self.done = True
+        try:
+            return (self.func, self.args, self.kwargs)
+        finally:
+            self.func, self.args, self.kwargs = None, None, None
+
+
+class DispatchDaemon(object):
+    __slots__ = ("hook", "next", "base", "poked", "interval")
+
+    def __init__(self, hook):
+        self.hook, self.next, self.poked = hook, 0, False
+        self.base = getattr(hook._class, "INTERVAL", DISPATCH_INTERVAL)
+        self.interval = self.base
+
+    def update(self, result, now):
+        # NOTE(dij): Only called with the Executer lock held.
+        if isinstance(result, (int, float)) and not isinstance(result, bool):
+            self.interval = self.base
+            self.next = now + min(max(result, 0), DISPATCH_IDLE_MAX)
+            return
+        if result is False and not self.poked:
+            self.interval = min(self.interval * 2, DISPATCH_IDLE_MAX)
+        else:
+            self.interval = self.base
+        self.next = now + self.interval
+
+
 class DispatchExecuter(Thread):
-    __slots__ = ("_sched", "_hooks", "_watch", "_service", "_signal", "_complete")
+    __slots__ = (
+        "_seq",
+        "_lock",
+        "_poll",
+        "_wake",
+        "_slack",
+        "_hooks",
+        "_watch",
+        "_timers",
+        "_pidfds",
+        "_service",
+        "_signal",
+        "_classes",
+        "_deadline",
+        "_complete",
+        "_cancelled",
+        "_deadlines",
+    )
 
     def __init__(self, service):
         Thread.__init__(self, name="SMD_DispatchExecuter", daemon=False)
-        self._sched = None
+        self._poll = epoll()
+        self._wake = eventfd(0, EFD_NONBLOCK | EFD_CLOEXEC)
+        self._seq = count()
+        self._lock = Lock()
+        self._slack = 1
         self._hooks = None
+        self._timers = list()
+        self._classes = dict()
+        self._cancelled = 0
+        self._deadlines = list()
         self._watch = list()
+        self._pidfds = dict()
         self._signal = Event()
         self._service = service
+        self._deadline = None
         self._complete = Event()
+        self._poll.register(self._wake, EPOLLIN)
 
     def run(self):
         self._service.debug("[dispatch/exec]: Starting processing Thread..")
+        self.power()
+        n = 0
         while not self._signal.is_set():
-            for h in self._hooks:
-                h.run(self._service, None, None)
-            self._run_sched()
-            self._check_entries()
-            self._signal.wait(1)
+            d = self._run_daemons()
+            if len(self._watch) > 0 and time() >= n:
+                self._check_entries()
+                n = time() + DISPATCH_INTERVAL
+            w = self._run_tasks()
+            if len(self._watch) > 0 and (d is None or n < d):
+                d = n
+            if d is not None:
+                d = max(d - time(), 0)
+                if w is None or d < w:
+                    w = d
+            del d
+            # NOTE(dij): With nothing to do, sleep until add_task or a watched
+            #            process wakes us up. A wake request made while we were
+            #            running stays in the eventfd, so it can't be lost.
+            self._deadline = None if w is None else time() + w
+            e = self._poll.poll(w)
+            # NOTE(dij): Clear the deadline while we're running, so any wake
+            #            request made until the next poll isn't skipped.
+            self._deadline = None
+            for f, _ in e:
+                if f == self._wake:
+                    try:
+                        eventfd_read(self._wake)
+                    except BlockingIOError:
+                        pass
+                    continue
+                self._check_pidfd(f)
+            del w, e
         self._service.debug("[dispatch/exec]: Stopping processing Thread..")
-        if self._sched is not None:
-            for i in self._sched.queue:
-                self._sched.cancel(i)
-            self._sched = None
-            del self._sched
+        with self._lock:
+            for i in self._timers:
+                i[3].release()
+            self._timers.clear()
+            self._deadlines.clear()
         if len(self._watch) > 0:
             for i in self._watch:
                 stop(i)
             self._watch.clear()
+        for f, i in self._pidfds.items():
+            stop(i)
+            close(f)
+        self._pidfds.clear()
+        self._poll.close()
+        close(self._wake)
         self._complete.set()
 
     def stop(self):
         self._signal.set()
+        self.wake()
         self._complete.wait(TIMEOUT_SEC_STOP)
 
     def start(self):
@@ -241,39 +732,197 @@ class DispatchExecuter(Thread):
             self._hooks = list()
         super(__class__, self).start()
 
-    def _run_sched(self):
-        if self._sched is None or self._sched.empty():
+    def wake(self, when=None):
+        if when is not None and self._deadline is not None and when >= self._deadline:
+            return
+        try:
+            eventfd_write(self._wake, 1)
+        except OSError:
+            pass
+
+    def watch(self, entry):
+        p = entry[0].pid() if callable(entry[0].pid) else entry[0].pid
+        # NOTE(dij): A pidfd becomes readable as soon as the process exits. Older
+        #            kernels (before 5.3) don't have them, so those processes are
+        #            polled every DISPATCH_INTERVAL instead.
+        try:
+            if pidfd_open is None:
+                raise OSError(0x26, "pidfd_open is not supported")
+            f = pidfd_open(p)
+            del p
+        except OSError:
+            self._watch.append(entry)
+            return self.wake()
+        self._pidfds[f] = entry
+        self._poll.register(f, EPOLLIN)
+
+    def _finish(self, entry):
+        with self._service.track(getattr(entry[1], "__name__", "process callback")):
+            self._exit(entry)
+
+    def _exit(self, entry):
+        # NOTE(dij): Call a "stop" function if it exists.
+        try:
+            f = getattr(entry[0], "stop")
+            if callable(f):
+                f()
+            del f
+        except (AttributeError, TypeError):
+            pass
+        stop(entry[0])
+        if not callable(entry[1]):
+            return
+        try:
+            entry[1](*entry[2], **entry[3])
+        except Exception as err:
+            self._service.error(
+                "[dispatch/exec]: Cannot execute process callback!", err
+            )
+
+    def poke(self, hooks):
+        if len(self._classes) == 0:
+            return
+        for h in hooks:
+            # NOTE(dij): RemoteHooks have no class, their daemons run in the worker.
+            d = self._classes.get(getattr(h, "_class", None))
+            if d is None:
+                continue
+            with self._lock:
+                for i in d:
+                    i.poked = True
+                    if i.interval == i.base:
+                        continue
+                    i.interval, i.next = i.base, min(i.next, time() + i.base)
+                    self.wake(i.next)
+            del d
+
+    def daemons(self, hooks):
+        self._hooks = [DispatchDaemon(h) for h in hooks]
+        for i in self._hooks:
+            self._classes.setdefault(i.hook._class, list()).append(i)
+
+    def _run_daemons(self):
+        r = None
+        for i in self._hooks:
+            if i.next <= time():
+                with self._lock:
+                    i.poked = False
+                v = i.hook.tick(self._service)
+                with self._lock:
+                    i.update(v, time())
+                del v
+            if r is None or i.next < r:
+                r = i.next
+        return r
+
+    def add(self, timeout, func, args, kwargs, priority, slack):
+        if slack is None:
+            slack = min(timeout * DISPATCH_SLACK, DISPATCH_SLACK_MAX)
+        t = DispatchTask(
+            time() + timeout, slack * self._slack, priority, func, args, kwargs
+        )
+        with self._lock:
+            n = next(self._seq)
+            heappush(self._timers, (t.time, priority, n, t))
+            heappush(self._deadlines, (t.deadline, n, t))
+            del n
+        self.wake(t.deadline)
+        return t
+
+    def power(self):
+        # NOTE(dij): Devices without an AC adapter (or that can't be read) are
+        #            treated as being on AC power.
+        s = 1
+        if read(DISPATCH_POWER_PATH, errors=False, strip=True) == "0":
+            s = DISPATCH_SLACK_BATTERY
+        if s == self._slack:
+            return
+        self._slack = s
+        self._service.debug(
+            f"[dispatch/exec]: Now on {'battery' if s > 1 else 'AC'} power, Task slack is now x{s}."
+        )
+        del s
+
+    def cancel(self, task):
+        with self._lock:
+            if task.done:
+                return False
+            task.release()
+            self._cancelled += 1
+            if self._cancelled < _COMPACT_SIZE:
+                return True
+            if self._cancelled * 2 < len(self._timers):
+                return True
+            self._timers = [i for i in self._timers if not i[3].done]
+            self._deadlines = [i for i in self._deadlines if not i[2].done]
+            heapify(self._timers)
+            heapify(self._deadlines)
+            self._cancelled = 0
+        return True
+
+    def _next_task(self, now):
+        with self._lock:
+            while len(self._timers) > 0:
+                t = self._timers[0][3]
+                if t.done:
+                    heappop(self._timers)
+                    self._cancelled -= 1
+                    continue
+                if t.time > now:
+                    return None
+                heappop(self._timers)
+                return t.release()
+        return None
+
+    def _run_tasks(self):
+        # NOTE(dij): Run everything that is due, then sleep until the earliest
+        #            deadline (due time + slack) of what is left, so Tasks that
+        #            are due within that window run together.
+        n = time()
+        while True:
+            f = self._next_task(n)
+            if f is None:
+                break
+            with self._service.track(getattr(f[0], "__name__", "task")):
+                try:
+                    f[0](*f[1], **f[2])
+                except Exception as err:
+                    self._service.error(
+                        f'[dispatch/exec]: Task "{getattr(f[0], "__name__", None)}" raised an error!',
+                        err,
+                    )
+            del f
+        with self._lock:
+            while len(self._deadlines) > 0 and self._deadlines[0][2].done:
+                heappop(self._deadlines)
+            if len(self._deadlines) == 0:
+                return None
+            return max(self._deadlines[0][0] - time(), 0)
+
+    def _check_pidfd(self, fd):
+        try:
+            self._poll.unregister(fd)
+        except OSError:
+            pass
+        close(fd)
+        i = self._pidfds.pop(fd, None)
+        if i is None:
             return
-        alarm(TIMEOUT_SEC_HOOK)
-        self._sched.run(blocking=False)
-        alarm(0)
+        # NOTE(dij): Chained processes (like backup's "Multi") start the next
+        #            process when polled, so we need to watch the new one.
+        if i[0].poll() is None:
+            return self.watch(i)
+        self._finish(i)
+        del i
 
     def _check_entries(self):
         if len(self._watch) == 0:
             return
-        alarm(TIMEOUT_SEC_HOOK)
-        for i in self._watch:
+        for i in list(self._watch):
             if not isinstance(i, tuple):
                 self._watch.remove(i)
                 continue
             if i[0].poll() is None:
                 continue
-            # NOTE(dij): Call a "stop" function if it exists.
-            try:
-                f = getattr(i[0], "stop")
-                if callable(f):
-                    f()
-                del f
-            except (AttributeError, TypeError):
-                pass
-            stop(i[0])
             self._watch.remove(i)
-            if not callable(i[1]):
-                continue
-            try:
-                i[1](*i[2], **i[3])
-            except Exception as err:
-                self._service.error(
-                    "[dispatch/exec]: Cannot execute process callback!", err
-                )
-        alarm(0)
+            self._finish(i)
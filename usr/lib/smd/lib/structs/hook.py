@@ -39,127 +39,207 @@
 #   functions. This class container allows for invocation of multiple hooks using
 #   a single function call.
 
-from signal import alarm
-from lib.constants import HOOK_OK, HOOK_ERROR
+from threading import Lock
+from inspect import iscoroutinefunction
+from lib.constants.config import LOG_TICKS
+from lib.constants import HOOK_OK, HOOK_ERROR, HOOK_DAEMON
 from lib.structs.message import Message, as_exception
-from lib.constants.config import TIMEOUT_SEC_HOOK, LOG_TICKS
+
+
+def _reply(r, message, queue):
+    queue.append(r)
+    return True
+
+
+def _reply_int(r, message, queue):
+    queue.append(Message(r))
+    return True
+
+
+def _reply_str(r, message, queue):
+    queue.append(Message(message.header(), {"result": r}))
+    return True
+
+
+def _reply_dict(r, message, queue):
+    queue.append(Message(message.header(), r))
+    return True
+
+
+def _reply_none(r, message, queue):
+    return True
+
+
+def _reply_bool(r, message, queue):
+    if r:
+        queue.append(Message(HOOK_OK))
+    else:
+        queue.append(Message(HOOK_ERROR, {"error": "unknown error occurred"}))
+    return True
+
+
+def _reply_list(r, message, queue):
+    for i in r:
+        if isinstance(i, Message):
+            queue.append(i)
+        elif isinstance(i, int):
+            queue.append(Message(i))
+        elif isinstance(i, dict):
+            queue.append(Message(message.header(), i))
+        elif isinstance(i, str):
+            queue.append(Message(message.header(), {"result": i}))
+    return True
+
+
+def _results(r, message, queue):
+    # NOTE(dij): Exact types are a single lookup, subclasses fall back to the
+    #            isinstance chain.
+    f = _SHAPES.get(type(r))
+    if f is not None:
+        return f(r, message, queue)
+    if isinstance(r, Message) or isinstance(r, Pending):
+        return _reply(r, message, queue)
+    if isinstance(r, bool):
+        return _reply_bool(r, message, queue)
+    if isinstance(r, int):
+        return _reply_int(r, message, queue)
+    if isinstance(r, dict):
+        return _reply_dict(r, message, queue)
+    if isinstance(r, str):
+        return _reply_str(r, message, queue)
+    if isinstance(r, list) or isinstance(r, tuple):
+        return _reply_list(r, message, queue)
+    return False
+
+
+def _shape(func):
+    # NOTE(dij): Functions that declare their return type (ex: "-> dict") get
+    #            that converter bound directly, anything else that comes back
+    #            goes through "_results".
+    a = getattr(func, "__annotations__", None)
+    if not a or "return" not in a:
+        return _results
+    v = a["return"]
+    if v is None:
+        v = type(None)
+    elif isinstance(v, str):
+        v = _NAMES.get(v)
+    t = _SHAPES.get(v)
+    if t is None:
+        return _results
+
+    def _convert(r, message, queue):
+        if type(r) is v:
+            return t(r, message, queue)
+        return _results(r, message, queue)
+
+    return _convert
+
+
+def correlate(message, queue):
+    # NOTE(dij): Replies carry the correlation ID of their request, so they can
+    #            be routed back to the connection that asked.
+    if message is None or message.cid() is None:
+        return
+    for m in queue:
+        if isinstance(m, Message) and m.cid() is None:
+            m.correlate(message.cid())
 
 
 class Hook(object):
-    __slots__ = ("_args", "_func", "_class")
+    __slots__ = ("_args", "_call", "_func", "_lane", "_class", "_reply")
 
     def __init__(self, obj, func, cls):
         self._func = func
         self._args = func.__code__.co_argcount
         self._class = cls
+        # NOTE(dij): Modules can set "LANE" to share an execution lane with other
+        #            modules, or to None to run on the Dispatcher Thread.
+        self._lane = getattr(cls, "LANE", cls.__name__)
         if obj is None:
             self._args += 1
+        # NOTE(dij): The call signature and reply conversion are picked once
+        #            here, so running the Hook doesn't need to check them again.
+        self._call, self._reply = self._adapter(), _shape(func)
 
-    def run(self, service, message, queue):
-        if LOG_TICKS:
-            service.debug(
-                f'[hook]: Running function "{self._func.__name__}" of "{self._class.__name__}".'
-            )
-        r, s = self._exec(service, message, queue)
-        if not s:
-            return False
-        if r is None:
-            return True
-        if isinstance(r, Message):
-            queue.append(r)
-        elif isinstance(r, bool):
-            if r:
-                queue.append(Message(HOOK_OK))
-            else:
-                queue.append(Message(HOOK_ERROR, {"error": "unknown error occurred"}))
-        elif isinstance(r, int):
-            queue.append(Message(r))
-        elif isinstance(r, dict):
-            queue.append(Message(message.header(), r))
-        elif isinstance(r, str):
-            queue.append(Message(message.header(), {"result": r}))
-        elif isinstance(r, list) or isinstance(r, tuple):
-            for i in r:
-                if isinstance(i, Message):
-                    queue.append(i)
-                elif isinstance(i, int):
-                    queue.append(Message(i))
-                elif isinstance(i, dict):
-                    queue.append(Message(message.header(), i))
-                elif isinstance(i, str):
-                    queue.append(Message(message.header(), {"result": i}))
-        else:
-            service.warning(
-                f'[hook]: The return result for function "{self._func.__name__}" (type: {type(r)}) of Hook '
-                f'for "{self._class.__name__}" was not able to be parsed!'
-            )
-        del r, s
-        return True
+    def __str__(self):
+        return f"{self._class.__name__}.{getattr(self._func, '__name__', None)}"
+
+    def lane(self):
+        return self._lane
 
-    def _exec(self, service, message, queue):
-        if not callable(self._func):
-            service.warning(
-                f'[hook]: Hook for "{self._class.__name__}" is missing a function!'
-            )
-            return None, False
+    def _adapter(self):
+        f = self._func
         if self._args == 5:
-            try:
+
+            def _call(service, message, queue):
                 service.warning(
-                    f'[hook]: Function "{self._func.__name__}" of Hook for "{self._class.__name__}" '
+                    f'[hook]: Function "{f.__name__}" of Hook for "{self._class.__name__}" '
                     f"is using the old format, please convert it!"
                 )
-                return self._func(service, None, queue, message), True
-            except Exception as err:
-                service.error(
-                    f'[hook]: Cannot execute function "{self._func.__name__}" of Hook for "{self._class.__name__}"!',
-                    err,
+                return f(service, None, queue, message)
+
+        elif self._args == 4:
+            _call = f
+        elif self._args == 3:
+
+            def _call(service, message, queue):
+                return f(service, message)
+
+        elif self._args == 2:
+
+            def _call(service, message, queue):
+                return f(service)
+
+        else:
+
+            def _call(service, message, queue):
+                return f()
+
+        if not iscoroutinefunction(f):
+            return _call
+
+        def _wait(service, message, queue):
+            return service.run_async(_call(service, message, queue))
+
+        return _wait
+
+    def run(self, service, message, queue):
+        with service.track(self, None if message is None else message.header()):
+            if LOG_TICKS:
+                service.debug(
+                    f'[hook]: Running function "{self._func.__name__}" of "{self._class.__name__}".'
                 )
-                if queue is not None:
-                    queue.append(as_exception(message.header(), err))
-            return False, False
-        if self._args == 4:
             try:
-                return self._func(service, message, queue), True
+                r = self._call(service, message, queue)
             except Exception as err:
                 service.error(
                     f'[hook]: Cannot execute function "{self._func.__name__}" of Hook for "{self._class.__name__}"!',
                     err,
                 )
-                if queue is not None:
+                if queue is not None and message is not None:
                     queue.append(as_exception(message.header(), err))
-            return False, False
-        if self._args == 3:
-            try:
-                return self._func(service, message), True
-            except Exception as err:
-                service.error(
-                    f'[hook]: Cannot execute function "{self._func.__name__}" of Hook for "{self._class.__name__}"!',
-                    err,
+                return False
+            if not self._reply(r, message, queue):
+                service.warning(
+                    f'[hook]: The return result for function "{self._func.__name__}" (type: {type(r)}) of Hook '
+                    f'for "{self._class.__name__}" was not able to be parsed!'
                 )
-                if queue is not None:
-                    queue.append(as_exception(message.header(), err))
-            return False, False
-        if self._args == 2:
+            del r
+        return True
+
+    def tick(self, service):
+        # NOTE(dij): Daemon Hooks don't reply, their result is when they want
+        #            to run next, so it's returned as is.
+        with service.track(self, HOOK_DAEMON):
             try:
-                return self._func(service), True
+                return self._call(service, None, None)
             except Exception as err:
                 service.error(
                     f'[hook]: Cannot execute function "{self._func.__name__}" of Hook for "{self._class.__name__}"!',
                     err,
                 )
-                if queue is not None:
-                    queue.append(as_exception(message.header(), err))
-            return False, False
-        try:
-            return self._func(), True
-        except Exception as err:
-            service.error(
-                f'[hook]: Cannot execute function "{self._func.__name__}" of Hook for "{self._class.__name__}"!',
-                err,
-            )
-            if queue is not None:
-                queue.append(as_exception(message.header(), err))
-        return False, False
+        return None
 
 
 class HookList(list):
@@ -168,10 +248,95 @@ class HookList(list):
     def __init__(self):
         list.__init__(self)
 
+    def lanes(self):
+        r = dict()
+        for h in self:
+            if h._lane not in r:
+                r[h._lane] = [h]
+            else:
+                r[h._lane].append(h)
+        return r
+
     def run(self, service, message):
         q = list()
-        alarm(TIMEOUT_SEC_HOOK)
         for h in self:
             h.run(service, message, q)
-        alarm(0)
         return q
+
+
+class Pending(object):
+    __slots__ = ("_eid", "_lock", "_queue", "_message", "_service", "_complete")
+
+    def __init__(self):
+        self._lock = Lock()
+        self._queue, self._complete = list(), False
+        self._eid, self._message, self._service = None, None, None
+
+    def _send(self, results):
+        # NOTE(dij): Only called with the lock held, so results keep their order.
+        q = list()
+        for r in results:
+            if isinstance(r, BaseException):
+                if self._message is not None:
+                    q.append(as_exception(self._message.header(), r))
+            elif not _results(r, self._message, q):
+                self._service.warning(
+                    f"[hook]: The deferred result (type: {type(r)}) was not able to be parsed!"
+                )
+        correlate(self._message, q)
+        if len(q) > 0:
+            self._service.send(self._eid, q)
+        del q
+
+    def add(self, result):
+        with self._lock:
+            if self._complete:
+                return
+            if self._service is None:
+                return self._queue.append(result)
+            self._send((result,))
+
+    def done(self):
+        return self._complete
+
+    def complete(self, result=None):
+        with self._lock:
+            if self._complete:
+                return
+            self._complete = True
+            if self._service is None:
+                return self._queue.append(result)
+            self._send((result,))
+
+    def bind(self, service, eid, message):
+        with self._lock:
+            if self._service is not None:
+                return
+            self._service, self._eid, self._message = service, eid, message
+            if len(self._queue) > 0:
+                self._send(self._queue)
+            self._queue = None
+
+
+_SHAPES = {
+    int: _reply_int,
+    str: _reply_str,
+    list: _reply_list,
+    dict: _reply_dict,
+    bool: _reply_bool,
+    tuple: _reply_list,
+    Message: _reply,
+    Pending: _reply,
+    type(None): _reply_none,
+}
+_NAMES = {
+    "int": int,
+    "str": str,
+    "list": list,
+    "dict": dict,
+    "bool": bool,
+    "None": type(None),
+    "tuple": tuple,
+    "Message": Message,
+    "Pending": Pending,
+}
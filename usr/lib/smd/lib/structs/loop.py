@@ -0,0 +1,102 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# loop.py
+#   The AsyncPoll class exposes an "epoll" like interface on top of an asyncio
+#   event loop. This allows the Server and Client to run their socket handling
+#   on the asyncio loop without needing a separate code path.
+
+from select import EPOLLIN, EPOLLOUT
+from asyncio import get_running_loop
+
+
+class AsyncPoll(object):
+    __slots__ = ("_loop", "_func", "_masks")
+
+    def __init__(self, loop, func):
+        self._loop = loop
+        self._func = func
+        self._masks = dict()
+
+    def close(self):
+        for i in list(self._masks.keys()):
+            self._unregister(i)
+        self._masks.clear()
+
+    def _on_loop(self):
+        try:
+            return get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _set(self, fd, mask):
+        o = self._masks.get(fd, 0)
+        if mask & EPOLLIN and not o & EPOLLIN:
+            self._loop.add_reader(fd, self._func, self, fd, EPOLLIN)
+        elif not mask & EPOLLIN and o & EPOLLIN:
+            self._loop.remove_reader(fd)
+        if mask & EPOLLOUT and not o & EPOLLOUT:
+            self._loop.add_writer(fd, self._func, self, fd, EPOLLOUT)
+        elif not mask & EPOLLOUT and o & EPOLLOUT:
+            self._loop.remove_writer(fd)
+        self._masks[fd] = mask
+        del o
+
+    def _unregister(self, fd):
+        o = self._masks.pop(fd, 0)
+        if o & EPOLLIN:
+            self._loop.remove_reader(fd)
+        if o & EPOLLOUT:
+            self._loop.remove_writer(fd)
+        del o
+
+    def unregister(self, fd):
+        if not isinstance(fd, int):
+            fd = fd.fileno()
+        if self._on_loop():
+            return self._unregister(fd)
+        self._loop.call_soon_threadsafe(self._unregister, fd)
+
+    def modify(self, fd, mask):
+        if not isinstance(fd, int):
+            fd = fd.fileno()
+        # NOTE(dij): Connections arm themselves for writing from the Dispatcher
+        #            Thread, so hand those off to the loop Thread.
+        if self._on_loop():
+            return self._set(fd, mask)
+        self._loop.call_soon_threadsafe(self._set, fd, mask)
+
+    def register(self, fd, mask=EPOLLIN):
+        self.modify(fd, mask)
@@ -39,13 +39,176 @@
 #   to be passed between client and server in binary format quickly.
 
 from lib.util import num, nes
-from struct import unpack, pack
+from struct import Struct
+from time import monotonic
+from codecs import getincrementaldecoder
+from select import poll, POLLOUT
 from traceback import format_exc
 from lib.structs.storage import Flex
 from lib.constants import HOOK_ERROR, HOOK_OK
 from json import loads, dumps, JSONDecodeError
 from socket import socket, AF_UNIX, SHUT_RDWR, SOCK_STREAM
-from lib.constants.config import HOOK_TRANSLATIONS, LOG_FRAME_LIMIT, TIMEOUT_SEC_MESSAGE
+from lib.constants.config import (
+    SOCKET_CODECS,
+    SOCKET_BUF_SIZE,
+    SOCKET_FRAME_MAX,
+    SOCKET_CHUNK_SIZE,
+    LOG_FRAME_LIMIT,
+    HOOK_TRANSLATIONS,
+    TIMEOUT_SEC_MESSAGE,
+)
+
+try:
+    from msgpack import packb, unpackb
+except ImportError:
+    packb, unpackb = None, None
+
+CODEC_JSON = "json"
+CODEC_BINARY = "msgpack"
+
+# NOTE(dij): The top bit of the length value in the header marks the payload as
+#            encoded with the binary codec instead of JSON. The next bit marks
+#            that the payload starts with a 4-byte correlation ID, which replies
+#            carry back so they can be matched to their request. The third
+#            bit marks that more frames of the same payload follow. Only the
+#            first frame of a chain carries the correlation ID.
+_FLAG_BINARY = 0x80000000
+_FLAG_CONTINUE = 0x20000000
+_FLAG_CORRELATE = 0x40000000
+_SIZE_MAX = 0x1FFFFFFF
+
+_CID = Struct(">I")
+_CID_MAX = 0x7FFFFFFF
+_HEADER = Struct(">BI")
+# NOTE(dij): Max amount of frames a Reader will return from a single read call
+#            so a busy connection cannot starve the others.
+_READ_MAX = 32
+
+
+def codecs():
+    r = list()
+    for i in SOCKET_CODECS:
+        if i == CODEC_BINARY and packb is None:
+            continue
+        if i == CODEC_JSON or i == CODEC_BINARY:
+            r.append(i)
+    if CODEC_JSON not in r:
+        r.append(CODEC_JSON)
+    return r
+
+
+def negotiate(offered):
+    if not isinstance(offered, list):
+        return CODEC_JSON
+    for i in codecs():
+        if i in offered:
+            return i
+    return CODEC_JSON
+
+
+def _decode(data, binary):
+    try:
+        if binary:
+            if unpackb is None:
+                raise OSError("payload uses an unsupported binary codec")
+            d = unpackb(data, raw=False)
+        else:
+            d = loads(data if isinstance(data, str) else str(data, "UTF-8"))
+    except (UnicodeDecodeError, JSONDecodeError, ValueError) as err:
+        raise OSError(f"payload data is malformed: {err}")
+    if not isinstance(d, dict):
+        raise OSError("payload data is an invalid type")
+    return d
+
+
+def _parse(header, size, stream):
+    if not isinstance(header, int) or header <= 0:
+        raise OSError("invalid header value")
+    b, c = (size & _FLAG_BINARY) != 0, (size & _FLAG_CORRELATE) != 0
+    s, n = (size & _FLAG_CONTINUE) != 0, size & _SIZE_MAX
+    if n > SOCKET_FRAME_MAX:
+        raise OSError(f"payload length {n} is larger than the max size")
+    if c and n < _CID.size:
+        raise OSError("invalid correlation ID length")
+    if stream is not None and (c or header != stream._header or b != stream._binary):
+        raise OSError("invalid continuation frame")
+    return b, c, s, n
+
+
+def _recv_exact(stream, view):
+    n, c = 0, len(view)
+    while n < c:
+        r = stream.recv_into(view[n:], c - n)
+        if r == 0:
+            if n == 0:
+                raise OSError(0x3E8, None)
+            raise OSError("invalid payload length (EOF?)")
+        n += r
+    del n, c
+
+
+def _send_frame(stream, parts):
+    v, p = [memoryview(i) for i in parts if len(i) > 0], None
+    try:
+        while len(v) > 0:
+            try:
+                n = stream.sendmsg(v)
+            except BlockingIOError:
+                # NOTE(dij): Non-blocking sockets may not be able to take the
+                #            whole frame at once, wait until it can be written.
+                if p is None:
+                    p = poll()
+                    p.register(stream.fileno(), POLLOUT)
+                if len(p.poll(TIMEOUT_SEC_MESSAGE * 1000)) == 0:
+                    raise OSError("timeout writing payload data")
+                continue
+            while n > 0:
+                if n < len(v[0]):
+                    v[0] = v[0][n:]
+                    break
+                n -= len(v[0])
+                v.pop(0)
+    finally:
+        del v, p
+
+
+class _Stream(object):
+    __slots__ = ("_cid", "_size", "_parts", "_binary", "_header", "_decoder")
+
+    def __init__(self, header, binary, cid):
+        self._cid, self._size, self._parts = cid, 0, list()
+        self._header, self._binary = header, binary
+        # NOTE(dij): JSON chunks are decoded to text as they arrive (a chunk
+        #            may end in the middle of a character), so only the text
+        #            is kept and not the raw frames.
+        self._decoder = None if binary else getincrementaldecoder("UTF-8")()
+
+    def raw(self):
+        if self._binary:
+            return b"".join(self._parts)
+        return "".join(self._parts).encode("UTF-8") + self._decoder.getstate()[0]
+
+    def add(self, data):
+        self._size += len(data)
+        if self._size > SOCKET_FRAME_MAX:
+            raise OSError(f"payload length {self._size} is larger than the max size")
+        if len(data) == 0:
+            return
+        if self._binary:
+            return self._parts.append(bytes(data))
+        try:
+            self._parts.append(self._decoder.decode(data))
+        except UnicodeDecodeError as err:
+            raise OSError(f"payload data is malformed: {err}")
+
+    def finish(self):
+        if self._binary:
+            return _decode(b"".join(self._parts), True)
+        try:
+            self._parts.append(self._decoder.decode(b"", True))
+        except UnicodeDecodeError as err:
+            raise OSError(f"payload data is malformed: {err}")
+        return _decode("".join(self._parts), False)
 
 
 def as_error(err):
@@ -68,9 +231,8 @@ def as_exception(header, err):
     )
 
 
-def _wait_for(sock, wait, timeout, errors):
-    t, k, h, o = timeout, None, wait, False
-    sock.settimeout(t)
+def _matcher(wait):
+    h, k, o = wait, None, False
     if (isinstance(wait, list) or isinstance(wait, tuple)) and len(wait) >= 2:
         if isinstance(wait[1], bool) and wait[1] and isinstance(wait[0], int):
             h, k, o = wait[0], None, True
@@ -83,19 +245,27 @@ def _wait_for(sock, wait, timeout, errors):
             h = num(h)
         except (TypeError, ValueError):
             h = HOOK_TRANSLATIONS.get(f"{h}".lower())
+    return h, k, o
+
+
+def _matches(r, h, k, o, errors):
+    if o and r.header() == HOOK_OK:
+        return True
+    if h is not None and r.header() == HOOK_ERROR and errors:
+        return True
+    if h is None:
+        return k is None or k in r
+    return r.header() == h and (k is None or k in r)
+
+
+def _wait_for(sock, wait, timeout, errors):
+    t, (h, k, o) = timeout, _matcher(wait)
+    sock.settimeout(t)
     try:
         while True:
             try:
                 r = Message(stream=sock)
-                if o and r.header() == HOOK_OK:
-                    return r
-                if h is not None and r.header() == HOOK_ERROR and errors:
-                    return r
-                if h is None and k is None:
-                    return r
-                if h is None and k is not None and k in r:
-                    return r
-                if r.header() == h and (k is None or k in r):
+                if _matches(r, h, k, o, errors):
                     return r
                 sock.setblocking(True)
                 sock.settimeout(t)
@@ -109,19 +279,21 @@ def _wait_for(sock, wait, timeout, errors):
     return None
 
 
+def _payload(payload):
+    if payload is None or isinstance(payload, dict):
+        return payload
+    if isinstance(payload, str):
+        try:
+            return loads(payload)
+        except JSONDecodeError as err:
+            raise ValueError(f'"payload" is not properly formatted JSON: {err}')
+    raise ValueError('"payload" must be a dict or JSON string')
+
+
 def send_message(sock, header, wait=None, timeout=None, payload=None, errors=True):
-    if payload is not None:
-        if isinstance(payload, dict):
-            d = payload
-        elif isinstance(payload, str):
-            try:
-                d = loads(payload)
-            except JSONDecodeError as err:
-                raise ValueError(f'"payload" is not properly formatted JSON: {err}')
-        else:
-            raise ValueError('"payload" must be a dict or JSON string')
-    else:
-        d = None
+    if isinstance(sock, Connection):
+        return sock.request(header, wait, timeout, payload, errors)
+    d = _payload(payload)
     try:
         s = socket(AF_UNIX, SOCK_STREAM)
         s.connect(sock)
@@ -148,19 +320,148 @@ def send_message(sock, header, wait=None, timeout=None, payload=None, errors=Tru
     return None
 
 
+class Connection(object):
+    __slots__ = ("_buf", "_seq", "_path", "_sock", "_pending", "_replies", "_timeout")
+
+    def __init__(self, sock, timeout=None):
+        self._seq, self._path, self._sock = 0, sock, None
+        self._buf = bytearray(SOCKET_BUF_SIZE)
+        self._pending, self._replies = set(), dict()
+        self._timeout = TIMEOUT_SEC_MESSAGE if not isinstance(timeout, int) else timeout
+
+    def __str__(self):
+        return self._path
+
+    def open(self):
+        if self._sock is not None:
+            return
+        s = socket(AF_UNIX, SOCK_STREAM)
+        try:
+            s.connect(self._path)
+        except OSError:
+            s.close()
+            raise
+        s.settimeout(self._timeout)
+        self._sock = s
+        del s
+
+    def close(self):
+        if self._sock is None:
+            return
+        try:
+            self._sock.shutdown(SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._sock = None
+        self._pending.clear()
+        self._replies.clear()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def send(self, header, payload=None):
+        self.open()
+        # NOTE(dij): The top bit of the ID is reserved for the Server.
+        self._seq = (self._seq + 1) & _CID_MAX
+        i = self._seq
+        m = Message(header, _payload(payload)).correlate(i)
+        try:
+            m.send(self._sock)
+        except OSError:
+            self.close()
+            raise
+        finally:
+            del m
+        self._pending.add(i)
+        return i
+
+    def wait(self, id, wait, timeout=None, errors=True):
+        h, k, o = _matcher(wait)
+        t = self._timeout if not isinstance(timeout, int) else timeout
+        try:
+            for r in self._replies.pop(id, ()):
+                if _matches(r, h, k, o, errors):
+                    return r
+            x = monotonic() + t
+            while True:
+                w = x - monotonic()
+                if w <= 0:
+                    raise TimeoutError("timed out waiting for a reply")
+                self._sock.settimeout(w)
+                try:
+                    r = Message(stream=self._sock, buf=self._buf)
+                except OSError:
+                    self.close()
+                    raise
+                v = r.cid()
+                if v == id or (v is None and len(self._pending) == 1):
+                    # NOTE(dij): Replies from Hooks that do not keep the ID
+                    #            can only be matched when nothing else is
+                    #            outstanding.
+                    if _matches(r, h, k, o, errors):
+                        return r
+                elif v in self._pending:
+                    self._replies.setdefault(v, list()).append(r)
+                del r, v, w
+        except KeyboardInterrupt:
+            return None
+        finally:
+            self._pending.discard(id)
+            self._replies.pop(id, None)
+            del h, k, o, t
+
+    def request(self, header, wait=None, timeout=None, payload=None, errors=True):
+        try:
+            i = self.send(header, payload)
+            if wait is None:
+                self._pending.discard(i)
+                return None
+            return self.wait(i, wait, timeout, errors)
+        except OSError as err:
+            if errors:
+                raise err
+            return None
+
+    def pipeline(self, requests, timeout=None, errors=True):
+        # NOTE(dij): Send everything first and then collect the replies. Replies
+        #            that arrive out of order are kept until they are asked for.
+        try:
+            r = [(self.send(i[0], i[2] if len(i) > 2 else None), i) for i in requests]
+            o = list()
+            for v, i in r:
+                if i[1] is None:
+                    self._pending.discard(v)
+                    o.append(None)
+                    continue
+                o.append(self.wait(v, i[1], timeout, errors))
+            del r
+            return o
+        except OSError as err:
+            if errors:
+                raise err
+            return None
+
+
 class Message(Flex):
-    __slots__ = ("_pid", "_uid", "_header", "_forward", "_multicast")
+    __slots__ = ("_cid", "_pid", "_uid", "_header", "_forward", "_multicast")
 
-    def __init__(self, header=None, payload=None, stream=None, pid=None, uid=None):
+    def __init__(
+        self, header=None, payload=None, stream=None, pid=None, uid=None, buf=None
+    ):
         if not isinstance(stream, socket) and not isinstance(header, int):
             raise ValueError('"header" must be an integer')
         Flex.__init__(self)
-        self._header, self._multicast = header, False
+        self._header, self._multicast, self._cid = header, False, None
         self._pid, self._uid, self._forward = pid, uid, False
         if payload is not None:
             self.update(payload)
         if isinstance(stream, socket):
-            self.recv(stream)
+            self.recv(stream, buf)
 
     def uid(self):
         return self._uid
@@ -180,56 +481,118 @@ class Message(Flex):
         v = self.get("error", None)
         return v if nes(v) else False
 
-    def recv(self, stream):
+    def recv(self, stream, buf=None):
         if not isinstance(stream, socket):
             raise OSError('"stream" must be a socket')
-        b = stream.recv(5)
-        if not isinstance(b, bytes):
-            raise OSError("invalid header")
-        if len(b) == 0:
-            raise OSError(0x3E8, None)
-        if len(b) != 5:
-            raise OSError("invalid header length")
+        if buf is None or len(buf) < _HEADER.size:
+            buf = bytearray(SOCKET_BUF_SIZE)
+        v, s = memoryview(buf), None
         try:
-            self._header, n = unpack(">BI", b)
-        except Exception:
-            raise OSError("invalid header value")
-        del b
-        if not isinstance(self._header, int) or self._header <= 0:
-            raise OSError("invalid header value")
-        if not isinstance(n, int) or n < 0:
-            raise OSError("invalid payload length value")
-        if n > 0:
-            p = stream.recv(n)
-            if not isinstance(p, bytes) or len(p) != n:
-                raise OSError("invalid payload length (EOF?)")
-            try:
-                d = loads(p.decode("UTF-8"))
-                if not isinstance(d, dict):
-                    raise OSError("payload data is an invalid type")
-                self.update(d)
-                del d
-            except (UnicodeDecodeError, JSONDecodeError) as err:
-                raise OSError(f"payload data is malformed: {err}")
-            finally:
-                del p
-        del n
-        stream.setblocking(False)
-
-    def send(self, stream):
-        if not isinstance(stream, socket):
-            raise OSError('"stream" must be a socket')
+            while True:
+                _recv_exact(stream, v[: _HEADER.size])
+                h, n = _HEADER.unpack_from(v)
+                b, c, m, n = _parse(h, n, s)
+                if n > len(v):
+                    # NOTE(dij): Don't keep oversized buffers around, only use
+                    #            them for this frame.
+                    v.release()
+                    v = memoryview(bytearray(n))
+                if n > 0:
+                    _recv_exact(stream, v[:n])
+                if c:
+                    self._cid = _CID.unpack_from(v)[0]
+                if s is None and not m:
+                    self._header = h
+                    if n > (_CID.size if c else 0):
+                        self.update(_decode(v[_CID.size if c else 0 : n], b))
+                    break
+                if s is None:
+                    s = _Stream(h, b, self._cid)
+                s.add(v[_CID.size if c else 0 : n])
+                if m:
+                    continue
+                self._header = h
+                self.update(s.finish())
+                break
+            del h, n, b, c, m
+        finally:
+            v.release()
+            del v, s
+
+    def frame(self, codec=None, cid=None):
+        r = list()
+        for i in self._frames(codec, cid):
+            r.extend(i)
+        return tuple(r)
+
+    def _frames(self, codec, cid):
+        if cid is None:
+            cid = self._cid
         if super().__len__() == 0:
-            return stream.sendall(pack(">BI", self._header, 0))
+            if cid is None:
+                yield (_HEADER.pack(self._header, 0),)
+                return
+            yield (
+                _HEADER.pack(self._header, _CID.size | _FLAG_CORRELATE),
+                _CID.pack(cid),
+            )
+            return
         try:
-            p = dumps(self._data)
-            if len(p) > 0xFFFFFFFF:
-                raise ConnectionError("payload data is too large")
-            stream.sendall(pack(">BI", self._header, len(p)))
-            stream.sendall(p.encode("UTF-8"))
-            del p
-        except (UnicodeEncodeError, JSONDecodeError) as err:
-            raise OSError(f"cannot convert message payload to JSON: {err}")
+            if codec == CODEC_BINARY and packb is not None:
+                p, f = packb(self._data, use_bin_type=True), _FLAG_BINARY
+            else:
+                p, f = dumps(self._data).encode("UTF-8"), 0
+        except (UnicodeEncodeError, TypeError, ValueError) as err:
+            raise OSError(f"cannot convert message payload to {codec}: {err}")
+        if len(p) > SOCKET_FRAME_MAX:
+            raise ConnectionError("payload data is too large")
+        if len(p) <= SOCKET_CHUNK_SIZE:
+            if cid is None:
+                yield (_HEADER.pack(self._header, len(p) | f), p)
+            else:
+                yield (
+                    _HEADER.pack(
+                        self._header, (len(p) + _CID.size) | f | _FLAG_CORRELATE
+                    ),
+                    _CID.pack(cid),
+                    p,
+                )
+            del p, f
+            return
+        # NOTE(dij): Large payloads are split into chunks (views of the encoded
+        #            payload, so nothing is copied) that each get their own frame
+        #            and the receiver decodes them as they arrive.
+        v = memoryview(p)
+        try:
+            for i in range(0, len(v), SOCKET_CHUNK_SIZE):
+                x = v[i : i + SOCKET_CHUNK_SIZE]
+                n = len(x) | f
+                if i + SOCKET_CHUNK_SIZE < len(v):
+                    n |= _FLAG_CONTINUE
+                if i > 0 or cid is None:
+                    yield (_HEADER.pack(self._header, n), x)
+                else:
+                    yield (
+                        _HEADER.pack(self._header, (n + _CID.size) | _FLAG_CORRELATE),
+                        _CID.pack(cid),
+                        x,
+                    )
+                del x, n
+        finally:
+            del v, p, f
+
+    def send(self, stream, codec=None):
+        if not isinstance(stream, socket):
+            raise OSError('"stream" must be a socket')
+        for i in self._frames(codec, None):
+            _send_frame(stream, i)
+
+    def cid(self):
+        return self._cid
+
+    def correlate(self, cid):
+        self._cid = cid
+        return self
 
     def is_multicast(self):
         return self._multicast
@@ -260,3 +623,157 @@ class Message(Flex):
     def set_forward(self, pid=None, uid=None, forward=True):
         self._forward = forward
         self._uid, self._pid = uid, pid
+
+
+class Reader(object):
+    __slots__ = (
+        "_buf",
+        "_pos",
+        "_data",
+        "_more",
+        "_want",
+        "_binary",
+        "_header",
+        "_stream",
+        "_correlate",
+    )
+
+    def __init__(self, size=SOCKET_BUF_SIZE):
+        self._buf = bytearray(max(size, _HEADER.size))
+        self._data = memoryview(self._buf)
+        self._stream = None
+        self._next()
+
+    def _next(self):
+        if self._data.obj is not self._buf:
+            self._data.release()
+            self._data = memoryview(self._buf)
+        self._pos, self._want, self._more = 0, _HEADER.size, False
+        self._binary, self._header, self._correlate = False, None, False
+
+    def reset(self):
+        self._next()
+        self._stream = None
+
+    def pending(self):
+        return self._pos > 0 or self._header is not None or self._stream is not None
+
+    def buffered(self):
+        # NOTE(dij): Returns the raw bytes of a partially read frame, so another
+        #            Reader can continue it with "feed". A partially read chain
+        #            of continuation frames is folded into a single frame.
+        r = b""
+        if self._stream is not None:
+            d = self._stream.raw()
+            n = len(d) | _FLAG_CONTINUE
+            if self._stream._binary:
+                n |= _FLAG_BINARY
+            if self._stream._cid is None:
+                r = _HEADER.pack(self._stream._header, n) + d
+            else:
+                r = (
+                    _HEADER.pack(
+                        self._stream._header, (n + _CID.size) | _FLAG_CORRELATE
+                    )
+                    + _CID.pack(self._stream._cid)
+                    + d
+                )
+            del d, n
+        if self._header is None:
+            return r + bytes(self._data[: self._pos])
+        n = self._want
+        if self._binary:
+            n |= _FLAG_BINARY
+        if self._correlate:
+            n |= _FLAG_CORRELATE
+        if self._more:
+            n |= _FLAG_CONTINUE
+        return r + _HEADER.pack(self._header, n) + bytes(self._data[: self._pos])
+
+    def feed(self, data, pid=None, uid=None):
+        r, v = list(), memoryview(data)
+        while len(v) > 0:
+            n = min(len(v), self._want - self._pos)
+            self._data[self._pos : self._pos + n] = v[:n]
+            v, self._pos = v[n:], self._pos + n
+            if self._pos < self._want:
+                continue
+            m = self._complete(pid, uid)
+            if m is not None:
+                r.append(m)
+            del m
+        v.release()
+        del v
+        return r
+
+    def _complete(self, pid, uid):
+        if self._header is None:
+            h, n = _HEADER.unpack_from(self._data)
+            b, c, s, n = _parse(h, n, self._stream)
+            if n > 0:
+                if n > len(self._buf):
+                    # NOTE(dij): Don't keep oversized buffers around, only use
+                    #            them for this frame.
+                    self._data.release()
+                    self._data = memoryview(bytearray(n))
+                self._header, self._binary, self._pos, self._want = h, b, 0, n
+                self._correlate, self._more = c, s
+                return None
+            if self._stream is None and not s:
+                self._next()
+                return Message(h, pid=pid, uid=uid)
+            self._header, self._binary, self._want, self._more = h, b, 0, s
+        try:
+            if self._stream is None and not self._more:
+                if not self._correlate:
+                    return Message(
+                        self._header,
+                        _decode(self._data[: self._want], self._binary),
+                        pid=pid,
+                        uid=uid,
+                    )
+                m = Message(self._header, pid=pid, uid=uid)
+                m._cid = _CID.unpack_from(self._data)[0]
+                if self._want > _CID.size:
+                    m.update(_decode(self._data[_CID.size : self._want], self._binary))
+                return m
+            if self._stream is None:
+                self._stream = _Stream(
+                    self._header,
+                    self._binary,
+                    _CID.unpack_from(self._data)[0] if self._correlate else None,
+                )
+            self._stream.add(
+                self._data[_CID.size if self._correlate else 0 : self._want]
+            )
+            if self._more:
+                return None
+            s, self._stream = self._stream, None
+            m = Message(s._header, s.finish(), pid=pid, uid=uid)
+            m._cid = s._cid
+            del s
+            return m
+        finally:
+            self._next()
+
+    def read(self, stream, pid=None, uid=None):
+        r = list()
+        while len(r) < _READ_MAX:
+            try:
+                n = stream.recv_into(self._data[self._pos : self._want])
+            except (BlockingIOError, InterruptedError):
+                break
+            if n == 0:
+                if len(r) > 0:
+                    break
+                if self.pending():
+                    raise OSError("invalid payload length (EOF?)")
+                raise OSError(0x3E8, None)
+            self._pos += n
+            if self._pos < self._want:
+                continue
+            m = self._complete(pid, uid)
+            if m is not None:
+                r.append(m)
+            del m
+        return r
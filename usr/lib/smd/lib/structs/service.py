@@ -42,18 +42,31 @@
 import threading
 
 from lib.util import nes
-from pprint import pformat
+from inspect import iscoroutine
 from lib.util.file import perm_check
 from lib.structs.logger import Logger
 from lib.structs.storage import Storage
-from signal import signal, SIGALRM, SIGINT
+from lib.structs.status import publish
+from signal import SIGINT
 from os import getgid, getpid, getuid, kill
-from lib.constants.config import LOG_PAYLOAD
+from asyncio import wait_for, new_event_loop, run_coroutine_threadsafe
+from lib.constants.config import CORE_ASYNC, LOG_PAYLOAD, TIMEOUT_SEC_HOOK
 from lib.structs.dispatcher import Dispatcher
 
+_LOCAL = threading.local()
+
 
 class Service(object):
-    __slots__ = ("config", "_log", "_pid", "_uid", "_read_only", "_dispatcher")
+    __slots__ = (
+        "config",
+        "_log",
+        "_pid",
+        "_uid",
+        "_opts",
+        "_loop",
+        "_read_only",
+        "_dispatcher",
+    )
 
     def __init__(self, name, modules, config, level, log, ro=False, journal=False):
         self._uid, self._pid = getuid(), getpid()
@@ -70,11 +83,14 @@ class Service(object):
             journal,
         )
         self._read_only = ro
+        # NOTE(dij): Kept so worker processes can be started with the same
+        #            logging options.
+        self._opts = (level, log, journal)
+        self._loop = new_event_loop() if CORE_ASYNC else None
         self._log.info(f'[service]: "{name}" starting up..')
         self._log.set_level(level, False)
         self._dispatcher = Dispatcher(self, modules)
         self.config = Storage(config)
-        signal(SIGALRM, self._watchdog)
         threading.excepthook = self._thread_except
 
     def save(self):
@@ -110,6 +126,50 @@ class Service(object):
     def is_server(self):
         return False
 
+    def isolated(self):
+        return None
+
+    def loaded(self, hooks):
+        pass
+
+    def _stop_loop(self):
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        except RuntimeError:
+            pass
+
+    def _close_loop(self):
+        if self._loop is None or self._loop.is_running() or self._loop.is_closed():
+            return
+        self._loop.close()
+
+    def run_async(self, coro, timeout=TIMEOUT_SEC_HOOK):
+        if not iscoroutine(coro):
+            raise ValueError('"coro" must be a coroutine')
+        if (
+            self._loop is None
+            or self._loop.is_closed()
+            or not self._loop.is_running()
+        ):
+            # NOTE(dij): Without the service loop, each Thread (ex: a lane) keeps
+            #            its own loop instead of creating one on every call.
+            v = getattr(_LOCAL, "loop", None)
+            if v is None or v.is_closed():
+                v = new_event_loop()
+                _LOCAL.loop = v
+            return v.run_until_complete(wait_for(coro, timeout))
+        f = run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return f.result(timeout)
+        except TimeoutError:
+            # NOTE(dij): Don't leave it running on the loop after we gave up.
+            f.cancel()
+            raise
+        finally:
+            del f
+
     def cancel(self, event):
         return self._dispatcher.cancel_task(event)
 
@@ -127,11 +187,11 @@ class Service(object):
     def set(self, name, value):
         return self.config.set(name, value)
 
-    def _watchdog(self, _, frame):
-        self._log.error(
-            f'[service]: Received a Watchdog timeout for "{frame.f_code.co_name}" '
-            f"({frame.f_code.co_filename}:{frame.f_lineno}) [{pformat(frame.f_locals, indent=4)}]"
-        )
+    def publish(self, name, data):
+        try:
+            publish(name, data)
+        except (OSError, ValueError, TypeError) as err:
+            self._log.error(f'[service]: Cannot publish the "{name}" status!', err)
 
     def _thread_except(self, args):
         self._log.error(
@@ -161,5 +221,11 @@ class Service(object):
     def get(self, name, default=None, set_non_exist=False):
         return self.config.get(name, default, set_non_exist)
 
-    def task(self, timeout, func, args=(), kwargs={}, priority=10):
-        return self._dispatcher.add_task(timeout, func, args, kwargs, priority)
+    def track(self, name, header=None):
+        return self._dispatcher.track(name, header)
+
+    def defer(self, func, args=(), kwargs={}):
+        return self._dispatcher.defer(func, args, kwargs)
+
+    def task(self, timeout, func, args=(), kwargs={}, priority=10, slack=None):
+        return self._dispatcher.add_task(timeout, func, args, kwargs, priority, slack)
@@ -0,0 +1,251 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# status.py
+#   Status snapshots are small JSON documents that the daemons publish into
+#   shared memory files under "DIRECTORY_STATUS". Readers map the file once and
+#   can then read the current state without asking the Server.
+
+from grp import getgrnam
+from struct import Struct
+from os.path import dirname
+from threading import Lock
+from json import dumps, loads
+from lib.util.file import ensure_dir
+from mmap import mmap, MAP_SHARED, PROT_READ, PROT_WRITE
+from os import (
+    chown,
+    close,
+    fstat,
+    fchmod,
+    fchown,
+    getpid,
+    O_RDWR,
+    O_CREAT,
+    O_RDONLY,
+    ftruncate,
+    open as os_open,
+)
+from lib.constants.config import (
+    STATUS_SIZE,
+    SOCKET_GROUP,
+    STATUS_RETRIES,
+    DIRECTORY_STATUS,
+)
+
+# NOTE(dij): The header is a sequence number, the payload length and the PID
+#            and start time of the writer. The sequence is odd while a write
+#            is in progress, so readers retry if it is odd or changed while
+#            they were copying (a seqlock). Snapshots from a writer that is
+#            gone are ignored.
+_SEQ = Struct("<Q")
+_LEN = Struct("<I")
+_OWNER = Struct("<IQ")
+_DATA = _SEQ.size + _LEN.size + _OWNER.size
+
+_LOCK = Lock()
+_OWNER_ID = [0, 0]
+_READERS = dict()
+_WRITERS = dict()
+
+
+def _owner():
+    # NOTE(dij): The PID is checked so a forked child gets its own start time.
+    p = getpid()
+    if _OWNER_ID[0] != p:
+        _OWNER_ID[0], _OWNER_ID[1] = p, _start_time(p) or 0
+    del p
+    return _OWNER_ID
+
+
+def _start_time(pid):
+    # NOTE(dij): The start time (field 22 of "/proc/<pid>/stat") tells a reused
+    #            PID apart from the writer and can be read by any user, unlike
+    #            signaling the PID.
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            v = f.read()
+    except OSError:
+        return None
+    try:
+        return int(v[v.rfind(b")") + 2 :].split()[19])
+    except (ValueError, IndexError):
+        return None
+    finally:
+        del v
+
+
+def _path(name):
+    if not isinstance(name, str) or len(name) == 0 or "/" in name:
+        raise ValueError(f'invalid status name "{name}"')
+    return f"{DIRECTORY_STATUS}/{name}"
+
+
+class Status(object):
+    __slots__ = ("_map", "_seq", "_lock")
+
+    def __init__(self, name):
+        p = _path(name)
+        ensure_dir(p, mode=0o0750)
+        try:
+            # NOTE(dij): The socket group needs to get into the directory to
+            #            read the snapshots.
+            chown(dirname(p), 0, getgrnam(SOCKET_GROUP).gr_gid)
+        except (KeyError, OSError):
+            pass
+        f = os_open(p, O_RDWR | O_CREAT, 0o0640)
+        try:
+            try:
+                fchown(f, 0, getgrnam(SOCKET_GROUP).gr_gid)
+                fchmod(f, 0o0640)
+            except (KeyError, OSError):
+                pass
+            if fstat(f).st_size != STATUS_SIZE:
+                ftruncate(f, STATUS_SIZE)
+            self._map = mmap(f, STATUS_SIZE, MAP_SHARED, PROT_READ | PROT_WRITE)
+        finally:
+            close(f)
+            del f, p
+        self._lock = Lock()
+        # NOTE(dij): Continue from the last sequence in the file (after a
+        #            restart), so readers never see it go backwards.
+        self._seq = _SEQ.unpack_from(self._map, 0)[0]
+        if self._seq & 1:
+            self._seq += 1
+
+    def close(self):
+        with self._lock:
+            self._map.close()
+
+    def clear(self):
+        # NOTE(dij): Keep the sequence going, but drop the payload and owner,
+        #            so readers stop returning it.
+        with self._lock:
+            self._seq += 1
+            _SEQ.pack_into(self._map, 0, self._seq)
+            _LEN.pack_into(self._map, _SEQ.size, 0)
+            _OWNER.pack_into(self._map, _SEQ.size + _LEN.size, 0, 0)
+            self._seq += 1
+            _SEQ.pack_into(self._map, 0, self._seq)
+
+    def publish(self, data):
+        b = dumps(data).encode("UTF-8")
+        if len(b) + _DATA > STATUS_SIZE:
+            raise ValueError(f"status size {len(b)} is larger than the max size")
+        with self._lock:
+            self._seq += 1
+            _SEQ.pack_into(self._map, 0, self._seq)
+            _LEN.pack_into(self._map, _SEQ.size, len(b))
+            _OWNER.pack_into(self._map, _SEQ.size + _LEN.size, *_owner())
+            self._map[_DATA : _DATA + len(b)] = b
+            self._seq += 1
+            _SEQ.pack_into(self._map, 0, self._seq)
+        del b
+
+
+def publish(name, data):
+    with _LOCK:
+        s = _WRITERS.get(name)
+        if s is None:
+            s = Status(name)
+            _WRITERS[name] = s
+    s.publish(data)
+    del s
+
+
+def clear_status():
+    # NOTE(dij): Called when the Server stops. It is not called on a restart
+    #            handoff, as the PID (and snapshots) stay the same.
+    with _LOCK:
+        for s in _WRITERS.values():
+            try:
+                s.clear()
+            finally:
+                s.close()
+        _WRITERS.clear()
+
+
+def read_status(name):
+    # NOTE(dij): Returns None if there is no snapshot (the Server may not
+    #            publish it), so callers can fall back to asking the Server.
+    x = _READERS.get(name)
+    if x is None:
+        try:
+            f = os_open(_path(name), O_RDONLY)
+        except (ValueError, OSError):
+            return None
+        try:
+            m = mmap(f, STATUS_SIZE, MAP_SHARED, PROT_READ)
+        except (ValueError, OSError):
+            return None
+        finally:
+            close(f)
+            del f
+        x = [m, None]
+        _READERS[name] = x
+    else:
+        m = x[0]
+    for _ in range(STATUS_RETRIES):
+        s = _SEQ.unpack_from(m, 0)[0]
+        if s == 0:
+            return None
+        if s & 1:
+            continue
+        n = _LEN.unpack_from(m, _SEQ.size)[0]
+        if n + _DATA > STATUS_SIZE:
+            continue
+        p, t = _OWNER.unpack_from(m, _SEQ.size + _LEN.size)
+        b = m[_DATA : _DATA + n]
+        if _SEQ.unpack_from(m, 0)[0] != s:
+            continue
+        if p == 0:
+            return None
+        # NOTE(dij): A sequence that moved since our last read means the writer
+        #            is still there. Only check the owner when it did not (or
+        #            on the first read).
+        if x[1] != s:
+            if x[1] is None and _start_time(p) != t:
+                return None
+            x[1] = s
+        elif _start_time(p) != t:
+            return None
+        try:
+            return loads(b)
+        except ValueError:
+            return None
+        finally:
+            del b
+    return None
@@ -0,0 +1,165 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# watchdog.py
+#   The Watchdog tracks the deadline of every running Hook function, task and
+#   process callback and reports the ones that overrun their time budget, with
+#   the Thread they are running in and how long they took.
+
+from sys import _current_frames
+from time import monotonic
+from itertools import count
+from heapq import heapify, heappop, heappush
+from threading import Thread, Condition, current_thread
+
+# NOTE(dij): Finished entries are left in the heap and dropped when they reach
+#            the top (lazy deletion). The heap is rebuilt without them once
+#            they are most of it, so high rate Hooks can't grow it without
+#            bound.
+_COMPACT_SIZE = 1024
+
+
+class Deadline(object):
+    __slots__ = (
+        "name",
+        "done",
+        "start",
+        "budget",
+        "header",
+        "thread",
+        "reported",
+        "_watchdog",
+    )
+
+    def __init__(self, watchdog, name, header, budget):
+        self.name, self.header = name, header
+        self.done, self.reported = False, False
+        self.start, self.budget = monotonic(), budget
+        self.thread, self._watchdog = current_thread(), watchdog
+
+    def __str__(self):
+        if self.header is None:
+            return f'"{self.name}"'
+        return f'"{self.name}" (0x{self.header:02X})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self._watchdog.done(self)
+
+    def elapsed(self):
+        return int((monotonic() - self.start) * 1000)
+
+
+class Watchdog(Thread):
+    __slots__ = ("_seq", "_heap", "_cond", "_active", "_budgets", "_service")
+
+    def __init__(self, service, budgets, default):
+        Thread.__init__(self, name="SMD_Watchdog", daemon=True)
+        self._seq = count()
+        self._heap = list()
+        self._cond = Condition()
+        self._active = 0
+        self._budgets = (budgets, default)
+        self._service = service
+
+    def run(self):
+        while True:
+            e = self._next()
+            if e is not None:
+                self._overrun(e)
+            del e
+
+    def _next(self):
+        with self._cond:
+            # NOTE(dij): Drop finished entries from the top first, so they don't
+            #            make us wake up for a deadline that no longer matters.
+            while len(self._heap) > 0 and self._heap[0][2].done:
+                heappop(self._heap)
+            if len(self._heap) == 0:
+                self._cond.wait()
+                return None
+            w = self._heap[0][0] - monotonic()
+            if w > 0:
+                self._cond.wait(w)
+                return None
+            return heappop(self._heap)[2]
+
+    def done(self, entry):
+        with self._cond:
+            entry.done = True
+            self._active -= 1
+            r = entry.reported
+        if not r:
+            return
+        self._service.warning(
+            f"[watchdog]: Function {entry} finished after {entry.elapsed()}ms "
+            f"(budget {entry.budget}ms)."
+        )
+
+    def track(self, name, header=None):
+        b = self._budgets[0].get(header, self._budgets[1])
+        e = Deadline(self, name, header, b)
+        with self._cond:
+            self._active += 1
+            if len(self._heap) > _COMPACT_SIZE and len(self._heap) > self._active * 4:
+                self._heap = [i for i in self._heap if not i[2].done]
+                heapify(self._heap)
+            heappush(self._heap, (e.start + b / 1000, next(self._seq), e))
+            # NOTE(dij): Only wake the Thread if this is now the first deadline.
+            if self._heap[0][2] is e:
+                self._cond.notify()
+        del b
+        return e
+
+    def _overrun(self, entry):
+        # NOTE(dij): It may have finished since it left the heap, so check again
+        #            with the lock held, which "done" also needs.
+        with self._cond:
+            if entry.done:
+                return
+            entry.reported = True
+            f = _current_frames().get(entry.thread.ident)
+            if f is None:
+                w = "unknown"
+            else:
+                w = f"{f.f_code.co_name} ({f.f_code.co_filename}:{f.f_lineno})"
+            self._service.error(
+                f"[watchdog]: Function {entry} has been running for {entry.elapsed()}ms "
+                f'(budget {entry.budget}ms) in Thread "{entry.thread.name}", now in {w}!'
+            )
+            del f, w
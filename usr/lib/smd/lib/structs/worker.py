@@ -0,0 +1,322 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# worker.py
+#   The WorkerHost class runs a Server module in a supervised child process and
+#   passes Messages to and from it over a socketpair. RemoteHooks stand in for
+#   the module Hooks in the Dispatcher.
+
+from sys import executable
+from lib.util import nes
+from itertools import count
+from time import monotonic
+from lib.util.exec import stop
+from threading import Thread, Lock
+from lib.structs.hook import Pending
+from subprocess import Popen, TimeoutExpired
+from lib.structs.message import Message, CODEC_BINARY, as_exception
+from socket import socketpair, AF_UNIX, SOCK_STREAM, SHUT_WR
+from lib.constants import HOOK_ERROR, HOOK_WORKER, MSG_ACTION, MSG_CONFIG
+from lib.constants.config import (
+    SOCKET_ROUTES,
+    SOCKET_BUF_SIZE,
+    TIMEOUT_SEC_HOOK,
+    TIMEOUT_SEC_STOP,
+    DIRECTORY_LIBEXEC,
+    DISPATCH_RESTART_MAX,
+)
+
+_ROUTE_MAX = 0x7FFFFFFF
+
+
+def wrap(type, message=None, cid=None, payload=None):
+    d = {"type": type}
+    # NOTE(dij): Names like "header" and "pid" are reserved in a Message, so
+    #            the wrapped values use different ones.
+    if message is not None:
+        d["hook"], d["data"] = message.header(), dict(message.items())
+        d["owner"] = (message.pid(), message.uid())
+        d["forwarded"], d["broadcast"] = message.is_forward(), message.is_multicast()
+    if payload is not None:
+        d.update(payload)
+    return Message(HOOK_WORKER, d).correlate(cid)
+
+
+def unwrap(message):
+    h, o = message.get("hook"), message.get("owner")
+    if not isinstance(h, int) or h <= 0:
+        return None
+    if not isinstance(o, (list, tuple)) or len(o) != 2:
+        o = (None, None)
+    m = Message(h, message.get("data"), pid=o[0], uid=o[1])
+    if message.get("forwarded"):
+        m.set_forward(o[0], o[1])
+    if message.get("broadcast"):
+        m.multicast()
+    del h, o
+    return m
+
+
+class RemoteHook(object):
+    __slots__ = ("_host", "_lane")
+
+    def __init__(self, host):
+        self._host = host
+        # NOTE(dij): The worker runs its own lanes, this one only hands off the
+        #            Messages so a full socket does not block the Dispatcher.
+        self._lane = f"worker/{host.name()}"
+
+    def lane(self):
+        return self._lane
+
+    def run(self, service, message, queue):
+        try:
+            queue.append(self._host.send(message))
+        except OSError as err:
+            service.error(
+                f'[worker/{self._host.name()}]: Cannot send Message 0x{message.header():02X} to the worker!',
+                err,
+            )
+            if queue is not None:
+                queue.append(as_exception(message.header(), err))
+            return False
+        return True
+
+
+class WorkerHost(object):
+    __slots__ = (
+        "_seq",
+        "_name",
+        "_lock",
+        "_proc",
+        "_sock",
+        "_write",
+        "_routes",
+        "_backoff",
+        "_service",
+        "_started",
+        "_running",
+    )
+
+    def __init__(self, service, name):
+        self._name = name
+        self._seq = count(1)
+        self._lock = Lock()
+        self._write = Lock()
+        self._routes = dict()
+        self._service = service
+        self._proc, self._sock = None, None
+        self._backoff, self._started, self._running = 1, 0, True
+
+    def name(self):
+        return self._name
+
+    def start(self):
+        with self._lock:
+            if not self._running or self._proc is not None:
+                return
+            s, c = socketpair(AF_UNIX, SOCK_STREAM)
+            v, f, j = self._service._opts
+            a = [
+                executable,
+                f"{DIRECTORY_LIBEXEC}/smd-worker",
+                "-m",
+                self._name,
+                "-f",
+                f"{c.fileno()}",
+                "-c",
+                self._service.config.path(),
+                "-n",
+                f"{v}",
+            ]
+            if isinstance(f, str):
+                a.extend(("-l", f))
+            if j:
+                a.append("-j")
+            try:
+                # NOTE(dij): Use a new session so a terminal interrupt is left to
+                #            the Server, which stops the workers itself.
+                self._proc = Popen(a, pass_fds=(c.fileno(),), start_new_session=True)
+            except OSError as err:
+                s.close()
+                self._service.error(
+                    f'[worker/{self._name}]: Cannot start the worker process!', err
+                )
+                return
+            finally:
+                c.close()
+                del a, c, v, f, j
+            self._sock, self._started = s, monotonic()
+            p = self._proc.pid
+        Thread(
+            target=self._read, args=(s,), name=f"SMD_Worker_{self._name}", daemon=True
+        ).start()
+        self._service.info(
+            f'[worker/{self._name}]: Started worker process PID({p}) for module "{self._name}".'
+        )
+        del s, p
+
+    def stop(self, server):
+        with self._lock:
+            self._running = False
+            s, p = self._sock, self._proc
+        if p is None:
+            return
+        server.debug(f'[worker/{self._name}]: Stopping worker PID({p.pid})..')
+        # NOTE(dij): Closing our write side lets the worker run its shutdown Hooks
+        #            and exit. Its last replies can still be read until then.
+        try:
+            s.shutdown(SHUT_WR)
+        except OSError:
+            pass
+        try:
+            p.wait(TIMEOUT_SEC_STOP)
+        except TimeoutExpired:
+            server.warning(
+                f'[worker/{self._name}]: Worker PID({p.pid}) did not stop in time!'
+            )
+        stop(p)
+        del s, p
+
+    def send(self, message):
+        with self._lock:
+            s = self._sock
+            if s is None:
+                raise OSError(f'worker "{self._name}" is not running')
+            x = (next(self._seq) % _ROUTE_MAX) + 1
+            p = Pending()
+            self._routes[x] = [p, monotonic(), False, message.header()]
+            while len(self._routes) > SOCKET_ROUTES:
+                del self._routes[next(iter(self._routes))]
+        try:
+            with self._write:
+                wrap(MSG_ACTION, message, x).send(s, CODEC_BINARY)
+        except OSError:
+            with self._lock:
+                self._routes.pop(x, None)
+            raise
+        finally:
+            del s, x
+        return p
+
+    def _read(self, sock):
+        b = bytearray(SOCKET_BUF_SIZE)
+        try:
+            while True:
+                self._process(Message(stream=sock, buf=b))
+        except OSError as err:
+            if err.errno != 0x3E8:
+                self._service.error(
+                    f'[worker/{self._name}]: Cannot read from the worker!', err
+                )
+        finally:
+            self._exited(sock)
+            del b
+
+    def _process(self, message):
+        if message.header() != HOOK_WORKER:
+            return self._service.warning(
+                f"[worker/{self._name}]: Received an invalid Message 0x{message.header():02X}!"
+            )
+        t = message.get("type")
+        if t == MSG_CONFIG:
+            if message.get("write"):
+                return self._service.save()
+            n = message.get("name")
+            if not nes(n):
+                return self._service.warning(
+                    f"[worker/{self._name}]: Received an invalid configuration change!"
+                )
+            self._service.debug(
+                f'[worker/{self._name}]: Setting configuration value "{n}" from the worker.'
+            )
+            return self._service.set(n, message.get("value"))
+        v = unwrap(message)
+        if v is None:
+            return self._service.warning(
+                f"[worker/{self._name}]: Received an invalid wrapped Message!"
+            )
+        if t == MSG_ACTION:
+            return self._service.forward(v)
+        if message.cid() is None:
+            return self._service.send(None, v)
+        with self._lock:
+            r = self._routes.get(message.cid())
+            if r is not None:
+                r[2] = True
+        if r is None:
+            return self._service.debug(
+                f"[worker/{self._name}]: Dropping reply 0x{v.header():02X} to an expired request."
+            )
+        r[0].add(v)
+        del t, v, r
+
+    def _exited(self, sock):
+        with self._lock:
+            r, self._routes = self._routes, dict()
+            p, self._proc, self._sock = self._proc, None, None
+            n = self._running
+        sock.close()
+        # NOTE(dij): Fail the requests that may still be running, so the senders
+        #            are not left waiting on a reply that will never come.
+        t = monotonic()
+        for v in r.values():
+            if v[2] or t - v[1] > TIMEOUT_SEC_HOOK:
+                continue
+            v[0].complete(
+                Message(
+                    HOOK_ERROR,
+                    {
+                        "hook": v[3],
+                        "error": f'worker "{self._name}" exited',
+                        "result": "Error processing request!",
+                    },
+                )
+            )
+        del r, t
+        if not n or p is None:
+            return
+        stop(p)
+        with self._lock:
+            if monotonic() - self._started > DISPATCH_RESTART_MAX:
+                self._backoff = 1
+            d = self._backoff
+            self._backoff = min(d * 2, DISPATCH_RESTART_MAX)
+        self._service.warning(
+            f'[worker/{self._name}]: Worker PID({p.pid}) exited ({p.returncode}), restarting in {d} seconds..'
+        )
+        self._service.task(d, self.start)
+        del p, d
@@ -0,0 +1,189 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# worker.py
+#   The Worker class is the daemon that runs a single isolated Server module in
+#   its own process. It is started and supervised by the Server and only talks
+#   to it over the socket it was given.
+
+from threading import Lock
+from socket import socket, AF_UNIX, SOCK_STREAM, SHUT_RDWR
+from signal import signal, SIGINT, SIG_IGN
+from lib.structs import Service, Message
+from lib.structs.message import CODEC_BINARY
+from lib.structs.worker import wrap, unwrap
+from lib.constants import (
+    VERSION,
+    MSG_POST,
+    MSG_ACTION,
+    MSG_CONFIG,
+    HOOK_WORKER,
+    HOOK_NOTIFICATION,
+)
+from lib.constants.config import (
+    NAME_SERVER,
+    LOG_PAYLOAD,
+    SOCKET_BUF_SIZE,
+    DIRECTORY_MODULES,
+)
+
+
+class Worker(Service):
+    __slots__ = ("_lock", "_name", "_socket")
+
+    def __init__(self, module, fd, config, level, log, journal):
+        Service.__init__(
+            self,
+            f"{NAME_SERVER}-{module}",
+            DIRECTORY_MODULES,
+            config,
+            level,
+            log,
+            True,
+            journal,
+        )
+        self._name = module
+        self._lock = Lock()
+        self._socket = socket(AF_UNIX, SOCK_STREAM, fileno=fd)
+        # NOTE(dij): The Server decides when we stop, by closing the socket.
+        signal(SIGINT, SIG_IGN)
+
+    def stop(self):
+        self._dispatcher.stop()
+        if self._socket is None:
+            return self._close_loop()
+        try:
+            self._socket.shutdown(SHUT_RDWR)
+            self._socket.close()
+        except OSError as err:
+            self.error("[main]: Cannot close the worker socket!", err)
+        self._socket = None
+        self._close_loop()
+
+    def start(self):
+        self.info(
+            f'[main]: Starting System Management Daemon Worker for "{self._name}" (v{VERSION})..'
+        )
+        self._dispatcher.start()
+        b = bytearray(SOCKET_BUF_SIZE)
+        try:
+            while True:
+                m = Message(stream=self._socket, buf=b)
+                if m.header() != HOOK_WORKER or m.get("type") != MSG_ACTION:
+                    self.warning(
+                        f"[conn]: Received an invalid Message 0x{m.header():02X}!"
+                    )
+                    continue
+                v = unwrap(m)
+                if v is None:
+                    continue
+                # NOTE(dij): Replies get the ID the Server used, so it can match
+                #            them to the request.
+                self._dispatcher.add(None, v.correlate(m.cid()))
+                self.debug(f"[conn]: Received Message 0x{v.header():02X}.")
+                if LOG_PAYLOAD:
+                    self.error(f"[dump]:  IN < {v}")
+                del m, v
+        except OSError as err:
+            if err.errno != 0x3E8:
+                return self.error("[conn]: Unexpected connection error!", err)
+            self.debug("[main]: Server has closed the worker socket.")
+        except Exception as err:
+            return self.error("[main]: Unexpected runtime error!", err)
+        finally:
+            self.info("[main]: Stopping System Management Daemon Worker..")
+            self.stop()
+            del b
+        self.info("[main]: Shutdown complete.")
+        return True
+
+    def is_server(self):
+        return True
+
+    def isolated(self):
+        return self._name
+
+    def save(self):
+        self._send_one(wrap(MSG_CONFIG, payload={"write": True}), None)
+
+    def set(self, name, value):
+        # NOTE(dij): The Server owns the configuration file, so keep a local
+        #            copy and pass the change along.
+        self._send_one(wrap(MSG_CONFIG, payload={"name": name, "value": value}), None)
+        return self.config.set(name, value)
+
+    def send(self, _, message):
+        if isinstance(message, Message):
+            return self._send_one(message)
+        if not isinstance(message, list) and not isinstance(message, tuple):
+            return
+        if len(message) == 0:
+            return
+        for i in message:
+            if not isinstance(i, Message):
+                continue
+            self._send_one(i)
+
+    def forward(self, message):
+        if message is None:
+            return
+        message.set_forward(self._pid, self._uid)
+        self.debug(
+            f"[service]: Forwarding message 0x{message.header():02X} to the Server."
+        )
+        self._send_one(message, MSG_ACTION)
+
+    def broadcast(self, message):
+        self.send(None, message)
+
+    def _send_one(self, message, type=MSG_POST):
+        h = message.header()
+        try:
+            if type is not None:
+                message = wrap(type, message, message.cid())
+            with self._lock:
+                message.send(self._socket, CODEC_BINARY)
+            self.debug(f"[conn]: Message 0x{h:02X} was sent.")
+            if LOG_PAYLOAD:
+                self.error(f"[dump]: OUT > {message}")
+        except Exception as err:
+            self.error(f"[conn]: Cannot send message 0x{h:02X}!", err)
+        del h
+
+    def notify(self, title, message=None, icon=None):
+        self._send_one(
+            Message(HOOK_NOTIFICATION, {"icon": icon, "title": title, "body": message})
+        )
@@ -0,0 +1,112 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# bench_hook.py
+#   Microbenchmark of the overhead of a single Hook call. Run it from the
+#   "/usr/lib/smd" directory with "python -m tests.bench_hook". To compare two
+#   versions, run it on each checkout, as it only uses the Hook class. Daemon
+#   Hooks use "tick" where the Hook has it and "run" where it does not.
+
+from timeit import repeat
+from lib.structs import hook
+from tests.stub import Service
+from lib.constants import HOOK_LOG
+
+_N = 200000
+_REPEAT = 7
+_RESULT = {"result": 1}
+
+
+class _Message(tuple):
+    # NOTE(dij): Stands in for Message, so only the cost of the Hook itself is
+    #            measured and not the Message encoding.
+    def __new__(cls, header, payload=None):
+        return tuple.__new__(cls, (header, payload))
+
+
+class _Incoming(object):
+    def header(self):
+        return HOOK_LOG
+
+
+class _Module(object):
+    pass
+
+
+def _daemon(server):
+    return None
+
+
+def _log_none(server, message):
+    return None
+
+
+def _log_dict(server, message):
+    return _RESULT
+
+
+def _log_bool(server, message):
+    return True
+
+
+def _log_annotated(server, message) -> dict:
+    return _RESULT
+
+
+def _bench(name, func, call):
+    h = hook.Hook(None, func, _Module)
+    t = min(repeat(lambda: call(h), number=_N, repeat=_REPEAT))
+    print(f"{name:30}{t / _N * 1e9:8.1f} ns")
+    del h, t
+
+
+def main():
+    hook.Message = _Message
+    s, m = Service(), _Incoming()
+    if hasattr(hook.Hook, "tick"):
+        _bench("HOOK_DAEMON", _daemon, lambda h: h.tick(s))
+    else:
+        _bench("HOOK_DAEMON", _daemon, lambda h: h.run(s, None, list()))
+    _bench("HOOK_LOG -> None", _log_none, lambda h: h.run(s, m, list()))
+    _bench("HOOK_LOG -> dict", _log_dict, lambda h: h.run(s, m, list()))
+    _bench("HOOK_LOG -> bool", _log_bool, lambda h: h.run(s, m, list()))
+    _bench(
+        "HOOK_LOG -> dict (annotated)", _log_annotated, lambda h: h.run(s, m, list())
+    )
+    del s, m
+
+
+if __name__ == "__main__":
+    main()
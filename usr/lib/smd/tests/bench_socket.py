@@ -0,0 +1,92 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# bench_socket.py
+#   Round trip benchmark of the Server socket handling, to compare the epoll
+#   core with the asyncio core (CORE_ASYNC). Start a Server, then run it from
+#   the "/usr/lib/smd" directory with "python -m tests.bench_socket [socket]".
+#   HOOK_HELLO is answered by the Server itself, so the Dispatcher and the
+#   module Hooks are not part of what is measured.
+
+from sys import argv
+from time import perf_counter
+from socket import socket, AF_UNIX
+from lib.constants import HOOK_HELLO
+from lib.structs.message import Message
+from lib.constants.config import SOCKET
+
+_COUNT = 3000
+_PIPELINE = 800
+
+
+def _round_trips(sock, count):
+    r = list()
+    for _ in range(count):
+        t = perf_counter()
+        Message(HOOK_HELLO).send(sock)
+        Message(stream=sock)
+        r.append(perf_counter() - t)
+    r.sort()
+    return r
+
+
+def _pipelined(sock, count):
+    t = perf_counter()
+    for _ in range(count):
+        Message(HOOK_HELLO).send(sock)
+    for _ in range(count):
+        Message(stream=sock)
+    return perf_counter() - t
+
+
+def main():
+    s = socket(AF_UNIX)
+    s.settimeout(5)
+    s.connect(argv[1] if len(argv) > 1 else SOCKET)
+    try:
+        v = _round_trips(s, _COUNT)
+        print(
+            f"round trip: {_COUNT / sum(v):.0f} msg/s, p50 {v[len(v) // 2] * 1e6:.0f}us, "
+            f"p99 {v[int(len(v) * 0.99)] * 1e6:.0f}us"
+        )
+        print(f"pipelined:  {_PIPELINE / _pipelined(s, _PIPELINE):.0f} msg/s")
+        del v
+    finally:
+        s.close()
+        del s
+
+
+if __name__ == "__main__":
+    main()
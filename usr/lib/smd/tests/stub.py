@@ -0,0 +1,78 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# stub.py
+#   Shared stand-ins used by the tests and benchmarks in this directory.
+
+from contextlib import nullcontext
+
+_CONTEXT = nullcontext()
+
+
+class Service(object):
+    # NOTE(dij): Stands in for the Server, errors and warnings are kept so the
+    #            tests can count them. "track" returns the same context every
+    #            time, so the benchmarks don't measure creating it.
+    def __init__(self):
+        self.errors = list()
+        self.warnings = list()
+
+    def info(self, message, err=None):
+        pass
+
+    def debug(self, message, err=None):
+        pass
+
+    def error(self, message, err=None):
+        self.errors.append(message)
+
+    def warning(self, message, err=None):
+        self.warnings.append(message)
+
+    def track(self, name, header=None):
+        return _CONTEXT
+
+
+class Clock(object):
+    # NOTE(dij): Replaces "time" in a module under test, so the tests decide
+    #            when time passes instead of sleeping.
+    __slots__ = ("now",)
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
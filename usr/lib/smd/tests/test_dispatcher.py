@@ -0,0 +1,91 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# test_dispatcher.py
+#   Tests for the Dispatcher message queue and coalescing. Run them from the
+#   "/usr/lib/smd" directory with "python -m unittest discover -s tests".
+
+from tests.stub import Service
+from unittest import TestCase, main
+from lib.constants import HOOK_MONITOR
+from lib.structs.message import Message
+from lib.structs.dispatcher import Dispatcher
+
+_TYPE = 1
+
+
+class TestCoalesce(TestCase):
+    def setUp(self):
+        self.dispatch = Dispatcher(Service(), None)
+        # NOTE(dij): No Hooks are loaded, so every message takes the un-hooked
+        #            early return in "_process".
+        self.dispatch._hooks = dict()
+
+    def _send(self):
+        self.dispatch.add(None, Message(HOOK_MONITOR, {"type": _TYPE}))
+
+    def _check(self, policy):
+        self.dispatch._coalesce[HOOK_MONITOR] = policy
+        self._send()
+        m = self.dispatch._next()
+        self.assertIsNotNone(m)
+        self.dispatch._process(m)
+        # NOTE(dij): The first message was handled, so this one can't be
+        #            coalesced into it and has to be queued.
+        self._send()
+        n = self.dispatch._next()
+        self.assertIsNotNone(n)
+        self.assertIsNot(n, m)
+        self.assertFalse(n.dropped)
+        self.assertIsNone(self.dispatch._next())
+        self.assertEqual(self.dispatch.coalesced().get(HOOK_MONITOR, 0), 0)
+
+    def test_merge_after_unhooked(self):
+        self._check("merge")
+
+    def test_replace_after_unhooked(self):
+        self._check("replace")
+
+    def test_merge_while_queued(self):
+        self.dispatch._coalesce[HOOK_MONITOR] = "merge"
+        self._send()
+        self._send()
+        self.assertIsNotNone(self.dispatch._next())
+        self.assertIsNone(self.dispatch._next())
+        self.assertEqual(self.dispatch.coalesced().get(HOOK_MONITOR, 0), 1)
+
+
+if __name__ == "__main__":
+    main()
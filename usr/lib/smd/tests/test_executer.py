@@ -0,0 +1,127 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# test_executer.py
+#   Tests for the DispatchExecuter daemon and Task timing. Run them from the
+#   "/usr/lib/smd" directory with "python -m unittest discover -s tests".
+
+from os import close
+from unittest.mock import patch
+from unittest import TestCase, main
+from tests.stub import Clock, Service
+from lib.structs.dispatcher import DispatchExecuter
+
+
+class _Module(object):
+    # NOTE(dij): Powers of two keep the Clock sums exact.
+    INTERVAL = 0.25
+
+
+class _Hook(object):
+    _class = _Module
+
+    def __init__(self, clock):
+        self.ticks = list()
+        self._clock = clock
+
+    def tick(self, service):
+        self.ticks.append(self._clock())
+        return False
+
+
+class TestExecuter(TestCase):
+    def setUp(self):
+        # NOTE(dij): The Thread is not started, "_run_daemons" and "_run_tasks"
+        #            are called here in its place and the Clock replaces "time",
+        #            so nothing depends on how fast this runs.
+        self.clock = Clock()
+        self.hook = _Hook(self.clock)
+        self.exec = DispatchExecuter(Service())
+        self.exec.daemons([self.hook])
+        self.daemon = self.exec._hooks[0]
+        self.patch = patch("lib.structs.dispatcher.time", self.clock)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.exec._poll.close()
+        close(self.exec._wake)
+
+    def _at(self, now):
+        self.clock.now = now
+        self.exec._run_daemons()
+        self.exec._run_tasks()
+
+    def _backoff(self):
+        # NOTE(dij): Ticks at 0, 0.5, 1.5 and 3.5 back off the interval to 4, so
+        #            the next tick is at 7.5.
+        for i in (0, 0.5, 1.5, 3.5):
+            self._at(i)
+        self.assertEqual(self.hook.ticks, [0, 0.5, 1.5, 3.5])
+        self.assertEqual(self.daemon.next, 7.5)
+
+    def _busy(self, poke):
+        # NOTE(dij): Stands in for a Task that keeps the Executer busy for 0.5
+        #            and pokes the daemon while it runs.
+        self.clock.now += 0.5
+        if poke:
+            self.exec.poke([self.hook])
+
+    def test_backoff(self):
+        self._backoff()
+        self.exec.add(0.25, self._busy, (False,), dict(), 10, 0)
+        self._at(3.75)
+        self._at(4.5)
+        self.assertEqual(len(self.hook.ticks), 4)
+        self._at(7.5)
+        self.assertEqual(self.hook.ticks[-1], 7.5)
+
+    def test_poke_while_busy(self):
+        # NOTE(dij): The daemon has to run again right after the Task and not at
+        #            its backed off time.
+        self._backoff()
+        self.exec.add(0.25, self._busy, (True,), dict(), 10, 0)
+        self._at(3.75)
+        self.assertEqual(len(self.hook.ticks), 4)
+        self.assertEqual(self.daemon.next, 4.5)
+        self._at(4.25)
+        self.assertEqual(len(self.hook.ticks), 4)
+        self._at(4.5)
+        self.assertEqual(self.hook.ticks[-1], 4.5)
+
+
+if __name__ == "__main__":
+    main()
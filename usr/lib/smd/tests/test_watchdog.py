@@ -0,0 +1,77 @@
+#!/usr/bin/false
+################################
+### iDigitalFlame  2016-2024 ###
+#                              #
+#            -/`               #
+#            -yy-   :/`        #
+#         ./-shho`:so`         #
+#    .:- /syhhhh//hhs` `-`     #
+#   :ys-:shhhhhhshhhh.:o- `    #
+#   /yhsoshhhhhhhhhhhyho`:/.   #
+#   `:yhyshhhhhhhhhhhhhh+hd:   #
+#     :yssyhhhhhyhhhhhhhhdd:   #
+#    .:.oyshhhyyyhhhhhhddd:    #
+#    :o+hhhhhyssyhhdddmmd-     #
+#     .+yhhhhyssshdmmddo.      #
+#       `///yyysshd++`         #
+#                              #
+########## SPACEPORT ###########
+### Spaceport + SMD
+#
+# Copyright (C) 2016 - 2024 iDigitalFlame
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# test_watchdog.py
+#   Tests for the Watchdog overrun reports. Run them from the "/usr/lib/smd"
+#   directory with "python -m unittest discover -s tests".
+
+from tests.stub import Service
+from unittest import TestCase, main
+from lib.structs.watchdog import Watchdog
+
+
+class TestWatchdog(TestCase):
+    def setUp(self):
+        # NOTE(dij): The Thread is not started, "_next" and "_overrun" are
+        #            called here in its place. A budget of zero is already due.
+        self.service = Service()
+        self.watchdog = Watchdog(self.service, dict(), 0)
+
+    def test_overrun(self):
+        e = self.watchdog.track("slow")
+        self.assertIs(self.watchdog._next(), e)
+        self.watchdog._overrun(e)
+        self.watchdog.done(e)
+        self.assertEqual(len(self.service.errors), 1)
+        self.assertEqual(len(self.service.warnings), 1)
+
+    def test_done_before_report(self):
+        e = self.watchdog.track("fast")
+        self.assertIs(self.watchdog._next(), e)
+        self.watchdog.done(e)
+        self.watchdog._overrun(e)
+        self.assertEqual(len(self.service.errors), 0)
+        self.assertEqual(len(self.service.warnings), 0)
+
+    def test_done_skipped(self):
+        e = self.watchdog.track("done")
+        v = self.watchdog.track("running")
+        self.watchdog.done(e)
+        self.assertIs(self.watchdog._next(), v)
+        self.assertEqual(len(self.watchdog._heap), 0)
+
+
+if __name__ == "__main__":
+    main()